@@ -0,0 +1,96 @@
+"""_simkernel.py - Fused cosine-similarity kernel for chunks of photo embeddings."""
+
+from typing import Any, Callable, Optional
+import numpy as np
+from app.utils.vector_utils import NDArrayFloat, normalize_rows
+
+try:
+    from numba import njit, prange
+except ImportError:  # pragma: no cover - optional dependency
+    njit = None  # type: ignore[assignment]
+
+# With more query vectors than this, one BLAS GEMM beats the fused loop
+MAX_FUSED_QUERIES = 32
+
+_fused_scores: Optional[Callable[[Any, Any, Any], None]] = None
+_int8_dots: Optional[Callable[[Any, Any, Any], None]] = None
+
+if njit is not None:
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _fused_scores_impl(photos: Any, queries: Any, out: Any) -> None:
+        """Normalize each photo row and dot it with every unit query in one pass."""
+        n, dim = photos.shape
+        k = queries.shape[0]
+        for i in prange(n):  # pylint: disable=not-an-iterable
+            nrm = 0.0
+            for d in range(dim):
+                nrm += photos[i, d] * photos[i, d]
+            inv = 1.0 / np.sqrt(nrm) if nrm > 0.0 else 1.0
+            for j in range(k):
+                s = 0.0
+                for d in range(dim):
+                    s += photos[i, d] * queries[j, d]
+                out[i, j] = s * inv
+
+    @njit(parallel=True, cache=True)
+    def _int8_dots_impl(codes: Any, query: Any, out: Any) -> None:
+        """Integer dot product of every int8 code row with an int8 query."""
+        n, dim = codes.shape
+        for i in prange(n):  # pylint: disable=not-an-iterable
+            acc = np.int32(0)
+            for d in range(dim):
+                acc += np.int32(codes[i, d]) * np.int32(query[d])
+            out[i] = acc
+
+    _fused_scores = _fused_scores_impl
+    _int8_dots = _int8_dots_impl
+
+
+def cosine_scores(photos: NDArrayFloat, queries: NDArrayFloat) -> NDArrayFloat:
+    """
+    Return the (N, K) cosine similarities between photo rows and unit queries.
+
+    ``photos`` may be unnormalized and is modified in place on the BLAS path.
+    The Numba kernel is used when it is installed and K is small; otherwise
+    rows are normalized in place and scored with a single matrix product.
+    """
+    if _fused_scores is not None and queries.shape[0] <= MAX_FUSED_QUERIES:
+        out = np.empty((photos.shape[0], queries.shape[0]), dtype=np.float32)
+        _fused_scores(photos, queries, out)
+        return out
+
+    result: NDArrayFloat = normalize_rows(photos) @ queries.T
+    return result
+
+
+def int8_kernel_available() -> bool:
+    """Return True when the compiled int8 dot-product kernel can be used."""
+    return _int8_dots is not None
+
+
+def int8_dots(
+    codes: np.ndarray[Any, np.dtype[np.int8]], query: np.ndarray[Any, np.dtype[np.int8]]
+) -> np.ndarray[Any, np.dtype[np.int32]]:
+    """Return int32 dot products of int8 code rows with an int8 query (needs numba)."""
+    if _int8_dots is None:
+        raise RuntimeError("int8 kernel requires numba")
+    out = np.empty(codes.shape[0], dtype=np.int32)
+    _int8_dots(codes, query, out)
+    return out
+
+
+def warm_up(dim: int) -> None:
+    """
+    Compile the Numba kernels for the dtypes and layouts used at query time.
+
+    Without this the first search pays the JIT (or on-disk cache load) cost.
+    Does nothing when numba is not installed.
+    """
+    if _fused_scores is None or _int8_dots is None:
+        return
+    photos = np.ones((2, dim), dtype=np.float32)
+    queries = normalize_rows(np.ones((1, dim), dtype=np.float32))
+    _fused_scores(photos, queries, np.empty((2, 1), dtype=np.float32))
+    codes = np.ones((2, dim), dtype=np.int8)
+    _int8_dots(codes, codes[0], np.empty(2, dtype=np.int32))
@@ -3,11 +3,39 @@
 from __future__ import annotations
 
 import logging
-from typing import Dict, Any, Optional, cast
+from typing import AsyncIterator, Dict, Any, Optional, cast
 import httpx
 
 logger = logging.getLogger(__name__)
 
+# One process-wide client so every BaseHTTPClient shares the same connection pool
+_SHARED_CLIENT: Optional[httpx.AsyncClient] = None
+
+
+def get_shared_client() -> httpx.AsyncClient:
+    """Return the process-wide AsyncClient, creating it on first use."""
+    global _SHARED_CLIENT  # pylint: disable=global-statement
+    if _SHARED_CLIENT is None or _SHARED_CLIENT.is_closed:
+        # HTTP/2 multiplexes concurrent requests to one host over a single connection
+        _SHARED_CLIENT = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=200,
+                max_keepalive_connections=100,
+                keepalive_expiry=30,
+            ),
+            headers={"User-Agent": "CCTV-MCP-Bridge/1.0"},
+        )
+    return _SHARED_CLIENT
+
+
+async def close_shared_client() -> None:
+    """Close the process-wide AsyncClient; call once on application shutdown."""
+    global _SHARED_CLIENT  # pylint: disable=global-statement
+    if _SHARED_CLIENT is not None:
+        await _SHARED_CLIENT.aclose()
+        _SHARED_CLIENT = None
+
 
 class BaseHTTPClient:
     """Base HTTP client providing GET, POST, and health check methods with error handling."""
@@ -21,10 +49,11 @@ class BaseHTTPClient:
         """
         self.base_url = base_url.rstrip("/")
         self.timeout = timeout
-        self.client = httpx.AsyncClient(
-            timeout=timeout,
-            headers={"User-Agent": "CCTV-MCP-Bridge/1.0"},
-        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Return the shared AsyncClient used for all requests."""
+        return get_shared_client()
 
     async def get(
         self, endpoint: str, params: Optional[Dict[str, Any]] = None
@@ -32,7 +61,7 @@ class BaseHTTPClient:
         """Perform a GET request with built-in error handling."""
         try:
             url = f"{self.base_url}{endpoint}"
-            response = await self.client.get(url, params=params)
+            response = await self.client.get(url, params=params, timeout=self.timeout)
             response.raise_for_status()
             return cast(Dict[str, Any], response.json())
         except httpx.HTTPStatusError as exc:
@@ -47,13 +76,34 @@ class BaseHTTPClient:
             logger.error("Unexpected error for GET %s: %s", endpoint, exc)
             raise
 
+    async def stream_get(
+        self, endpoint: str, params: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[bytes]:
+        """Stream a GET response body in chunks instead of buffering it in memory."""
+        url = f"{self.base_url}{endpoint}"
+        try:
+            async with self.client.stream(
+                "GET", url, params=params, timeout=self.timeout
+            ) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes():
+                    yield chunk
+        except httpx.HTTPStatusError as exc:
+            logger.error(
+                "HTTP error %s for GET %s: %s", exc.response.status_code, endpoint, exc
+            )
+            raise
+        except httpx.RequestError as exc:
+            logger.error("Request error for GET %s: %s", endpoint, exc)
+            raise
+
     async def post(
         self, endpoint: str, json_data: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         """Perform a POST request with built-in error handling."""
         try:
             url = f"{self.base_url}{endpoint}"
-            response = await self.client.post(url, json=json_data)
+            response = await self.client.post(url, json=json_data, timeout=self.timeout)
             response.raise_for_status()
             return cast(Dict[str, Any], response.json())
         except httpx.HTTPStatusError as exc:
@@ -75,7 +125,3 @@ class BaseHTTPClient:
             return response.get("status") == "healthy"
         except Exception:
             return False
-
-    async def close(self) -> None:
-        """Close the underlying HTTP client session."""
-        await self.client.aclose()
@@ -1,13 +1,71 @@
-"""Configuration module for environment variables."""
+"""Configuration module: service settings read once from the environment."""
 
-import os
-from dotenv import load_dotenv
+from pydantic import AliasChoices, Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
-load_dotenv()
 
-# MongoDB configuration
-MONGO_URI = os.getenv("MONGO_HOST")
-MONGO_DB = os.getenv("MONGO_DB", "nill-home")
-FACES_COLLECTION = os.getenv("FACE_COLLECTION", "nill-home-faces")
-KNOWN_FACES_COLLECTION = os.getenv("KNOWN_FACES_COLLECTION", "nill-known-faces")
-MONGO_COLLECTION = os.getenv("MONGO_COLLECTION", "nill-home-photos")
+class Settings(BaseSettings):
+    """Service settings, loaded from environment variables and `.env`."""
+
+    model_config = SettingsConfigDict(env_file=".env", extra="ignore")
+
+    # Root log level; INFO adds a line per request, so production keeps WARNING
+    log_level: str = "WARNING"
+
+    # MongoDB configuration
+    mongo_uri: str | None = Field(
+        default=None, validation_alias=AliasChoices("MONGO_HOST", "MONGO_URI")
+    )
+    mongo_db: str = "nill-home"
+    faces_collection: str = Field(
+        default="nill-home-faces", validation_alias="FACE_COLLECTION"
+    )
+    known_faces_collection: str = "nill-known-faces"
+    photos_collection: str = Field(
+        default="nill-home-photos", validation_alias="MONGO_COLLECTION"
+    )
+    # Connection pool of the process-wide MongoClient. Each Uvicorn worker has its
+    # own pool, so the server sees up to workers * MONGO_MAX_POOL_SIZE connections
+    mongo_max_pool_size: int = 200
+    mongo_min_pool_size: int = 10
+    mongo_max_idle_time_ms: int = 300_000
+    mongo_server_selection_timeout_ms: int = 3000
+    # Worker threads for sync routes and run_in_threadpool (AnyIO default: 40).
+    # Each thread holds at most one pooled connection, so keep it <= max pool size
+    threadpool_size: int = 100
+    # Wire compression, in order of preference; the server picks the first it supports
+    mongo_compressors: str = "zstd,snappy,zlib"
+    # Only used when zlib is the negotiated compressor (-1 = zlib default, 9 = max)
+    mongo_zlib_compression_level: int = 6
+
+    # Embedding / vector search configuration
+    embedding_dim: int = 128
+    # Name of the Atlas Vector Search index; empty disables server-side search
+    vector_search_index: str = ""
+    vector_search_limit: int = 100
+    # Atlas automatic quantization for the vector index: "", "scalar" (int8) or "binary"
+    vector_search_quantization: str = "scalar"
+    # In-process ANN index over photo embeddings (used when vector search is off)
+    ann_index: bool = False
+    ann_top_k: int = 100
+    # Keep int8 codes of the index rows for brute-force search (requires numba)
+    ann_quantize: bool = False
+    # Optional slim {_id, embedding} collection, kept in sync from the faces
+    # collection and scanned instead of it; empty disables it
+    face_vectors_collection: str = ""
+
+    # Seconds a cached known-faces list stays valid even if its version probe matches
+    known_faces_cache_ttl: float = 60.0
+    # Base URL of an object store / CDN serving JPEGs as faces/<filename> and
+    # photos/<filename>. When set, the filename image endpoints redirect there
+    # instead of proxying bytes
+    image_base_url: str = ""
+
+    # Seconds single-image lookups are served from the in-process cache
+    known_face_image_cache_ttl: float = 300.0
+    photo_image_cache_ttl: float = 30.0
+    # Upper bound on the image bytes held by the CCTV photo cache
+    photo_image_cache_bytes: int = 64 * 1024 * 1024
+
+
+settings = Settings()
@@ -1,22 +1,74 @@
 """Database connection helpers for MongoDB."""
 
-from typing import Tuple
-from pymongo import MongoClient
+import logging
+from functools import lru_cache
+from typing import Any, Dict, Tuple
+from pymongo import ASCENDING, DESCENDING, MongoClient
 from pymongo.collection import Collection
-from app.config import (
-    MONGO_URI,
-    MONGO_DB,
-    FACES_COLLECTION,
-    KNOWN_FACES_COLLECTION,
-    MONGO_COLLECTION,  # ✅ The photos collection name
-)
+from pymongo.errors import PyMongoError
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Set once ensure_indexes has run in this process
+_indexes_ensured = False
+
+
+@lru_cache(maxsize=1)
+def get_mongo_client() -> MongoClient[Dict[str, Any]]:
+    """Return the process-wide MongoClient; its connection pool is shared by all callers."""
+    return MongoClient(
+        settings.mongo_uri,
+        maxPoolSize=settings.mongo_max_pool_size,
+        minPoolSize=settings.mongo_min_pool_size,
+        maxIdleTimeMS=settings.mongo_max_idle_time_ms,
+        serverSelectionTimeoutMS=settings.mongo_server_selection_timeout_ms,
+        retryReads=True,
+        retryWrites=True,
+        # Compress wire traffic (embedding and image blobs) when the server supports it
+        compressors=settings.mongo_compressors,
+        zlibCompressionLevel=settings.mongo_zlib_compression_level,
+        uuidRepresentation="standard",
+    )
+
+
+def close_mongo_client() -> None:
+    """Close the process-wide MongoClient if it was created."""
+    if get_mongo_client.cache_info().currsize:
+        get_mongo_client().close()
+        get_mongo_client.cache_clear()
 
 
 def get_mongo_collections() -> Tuple[Collection, Collection, Collection]:
-    """Initialize MongoDB connection and return face, known face, and photos collections."""
-    client = MongoClient(MONGO_URI)
-    db = client[MONGO_DB]
-    faces = db[FACES_COLLECTION]
-    known_faces = db[KNOWN_FACES_COLLECTION]
-    photos = db[MONGO_COLLECTION]
+    """Return face, known face, and photos collections from the shared MongoClient."""
+    client = get_mongo_client()
+    db = client[settings.mongo_db]
+    faces = db[settings.faces_collection]
+    known_faces = db[settings.known_faces_collection]
+    photos = db[settings.photos_collection]
     return faces, known_faces, photos
+
+
+def ensure_indexes(
+    faces: Collection, known_faces: Collection, photos: Collection
+) -> None:
+    """Create the indexes backing the FaceSearcher queries, once per process."""
+    global _indexes_ensured  # pylint: disable=global-statement
+    if _indexes_ensured:
+        return
+
+    try:
+        # Multikey index for {"matched_persons": {"$in": [...]}}
+        faces.create_index([("matched_persons", ASCENDING)])
+        # Equality on has_faces first, then face_count for the unknown-faces filter
+        faces.create_index([("has_faces", ASCENDING), ("face_count", ASCENDING)])
+        # Point lookups used by the image endpoints
+        faces.create_index([("filename", ASCENDING)])
+        known_faces.create_index([("name", ASCENDING)])
+        photos.create_index([("filename", ASCENDING)])
+        # Newest-first listings: find_one(sort=[("date", -1)]) reads the first key
+        faces.create_index([("bsonTime", DESCENDING)])
+        photos.create_index([("date", DESCENDING)])
+        _indexes_ensured = True
+    except PyMongoError as e:
+        logger.warning("Could not create MongoDB indexes: %s", e)
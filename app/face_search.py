@@ -1,11 +1,13 @@
 """face_search.py - MongoDB-based search for known, unknown, and CCTV faces."""
 
-from typing import Any, Dict, List, Optional, cast
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple, cast
 from pymongo.collection import Collection
 import logging
+import time
+from app.config import settings
+from app.utils.cache import TTLCache
 
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
 
 # Fields that hold image/binary payloads and should be excluded in metadata queries
 binary_fields = {
@@ -15,6 +17,45 @@ binary_fields = {
     "face_embedding": 0,
 }
 
+# Fields read by the image endpoints (decode_image_field uses image or data)
+image_fields = {"_id": 0, "image": 1, "data": 1}
+
+# Default fields returned for the latest CCTV entry (no image payload)
+latest_cctv_fields = {"_id": 1, "filename": 1, "date": 1, "camera_location": 1}
+
+# Cursor batch size for metadata-only listings: small documents, so one or
+# two replies carry a typical result and need at most one getMore
+METADATA_BATCH_SIZE = 1000
+
+# Upper bound on $in list sizes for bulk lookups
+IN_QUERY_CHUNK = 1000
+
+# Entries kept in the CCTV photo image cache (also bounded by bytes)
+IMAGE_CACHE_SIZE = 256
+
+# Server-side predicate: more detected faces than matched persons.
+# Non-array matched_persons counts as zero matches, like the Python check.
+unknown_faces_query = {
+    "has_faces": True,
+    "$expr": {
+        "$gt": [
+            "$face_count",
+            {
+                "$cond": [
+                    {"$isArray": "$matched_persons"},
+                    {"$size": "$matched_persons"},
+                    0,
+                ]
+            },
+        ]
+    },
+}
+
+
+def image_size(doc: Dict[str, Any]) -> int:
+    """Return the length of the image payloads held by an image-fields document."""
+    return sum(len(doc[field]) for field in ("image", "data") if doc.get(field))
+
 
 class FaceSearcher:
     """Search helper for known, unknown and CCTV face data stored in MongoDB."""
@@ -29,6 +70,16 @@ class FaceSearcher:
         self.faces_collection = faces_collection
         self.known_faces_collection = known_faces_collection
         self.photos_collection = photos_collection
+        # (version key, load time, documents) for the known-faces collection
+        self._known_cache: Optional[
+            Tuple[Tuple[int, Any], float, List[Dict[str, Any]]]
+        ] = None
+        # Photo image lookups keyed by filename; full frames, so bounded by bytes
+        self._photo_image_cache: TTLCache[Dict[str, Any]] = TTLCache(
+            IMAGE_CACHE_SIZE,
+            max_bytes=settings.photo_image_cache_bytes,
+            sizeof=image_size,
+        )
 
         logger.info(
             "FaceSearcher initialized with collections: faces=%s, known_faces=%s, photos=%s",
@@ -46,60 +97,144 @@ class FaceSearcher:
             faces_collection.find({"matched_persons": {"$in": [name]}})
         Therefore: NO projection is allowed in this function.
         """
-        logger.info("Searching for known faces by name='%s'", name)
+        # Per-name helper; /faces/known uses find_known_faces_by_names instead
+        logger.debug("Searching for known faces by name='%s'", name)
 
         query = {"matched_persons": {"$in": [name]}}
         cursor = self.faces_collection.find(query)  # test checks this exact call
         results = list(cursor)
 
-        logger.info("Found %d documents for name '%s'", len(results), name)
+        logger.debug("Found %d documents for name '%s'", len(results), name)
         return results
 
     # ------------------------------------------------------------------
-    def find_unknown_faces(self) -> List[Dict[str, Any]]:
+    def find_known_faces_by_names(
+        self, names: List[str]
+    ) -> Tuple[List[Dict[str, Any]], Set[str]]:
         """
-        Return metadata for unknown faces without binary image data.
-        Unknown faces are: face_count > matched_persons_count.
+        Return metadata of photos containing any of ``names`` and the names found.
+
+        One aggregation replaces a lookup per name. MongoDB strips the binary
+        fields and returns each filename once (the newest copy), however many
+        of the names or stored duplicates it has. Names are collected from
+        every copy, so a person only seen in an older duplicate is still found.
         """
-        logger.info("Searching for unknown faces (no binary payload)")
+        logger.info("Searching for known faces by %d names", len(names))
 
-        cursor = self.faces_collection.find({"has_faces": True}, binary_fields)
-        results = list(cursor)
+        pipeline: List[Dict[str, Any]] = [
+            {"$match": {"matched_persons": {"$in": names}}},
+            {"$project": binary_fields},
+            {
+                "$group": {
+                    # Documents without a filename are kept individually
+                    "_id": {"$ifNull": ["$filename", "$_id"]},
+                    "doc": {"$top": {"sortBy": {"_id": -1}, "output": "$$ROOT"}},
+                    "names": {"$addToSet": "$matched_persons"},
+                }
+            },
+        ]
+        cursor = self.faces_collection.aggregate(
+            pipeline, batchSize=METADATA_BATCH_SIZE, allowDiskUse=False
+        )
 
-        unknowns: List[Dict[str, Any]] = []
+        wanted = set(names)
+        found: Set[str] = set()
+        results: List[Dict[str, Any]] = []
+        for group in cursor:
+            results.append(group["doc"])
+            for persons in group.get("names", []):
+                if isinstance(persons, list):
+                    found.update(wanted.intersection(persons))
 
-        for doc in results:
-            face_count = doc.get("face_count", 0)
-            matched = doc.get("matched_persons", [])
-            matched_count = len(matched) if isinstance(matched, list) else 0
+        logger.info("Found %d documents for %d names", len(results), len(found))
+        return results, found
 
-            if face_count > matched_count:
-                unknowns.append(doc)
+    # ------------------------------------------------------------------
+    def find_unknown_faces(
+        self, skip: int = 0, limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Return metadata for unknown faces without binary image data.
+        Unknown faces are: face_count > matched_persons_count.
 
+        Filtering, projection and paging run in one aggregation pipeline. Pages
+        (``skip``/``limit``) are taken newest first so they stay stable.
+        """
+        logger.info("Searching for unknown faces (no binary payload)")
+        unknowns = list(self.iter_unknown_faces(skip=skip, limit=limit))
         logger.info("Found %d unknown face entries", len(unknowns))
         return unknowns
 
+    def iter_unknown_faces(
+        self, skip: int = 0, limit: Optional[int] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Yield unknown-face metadata as MongoDB returns it, like find_unknown_faces.
+
+        The query is only sent once iteration starts.
+        """
+        # Filtering happens in MongoDB, so fully matched photos never cross the wire
+        pipeline: List[Dict[str, Any]] = [{"$match": unknown_faces_query}]
+        if skip or limit is not None:
+            pipeline.append({"$sort": {"_id": -1}})
+        if skip:
+            pipeline.append({"$skip": skip})
+        if limit is not None:
+            pipeline.append({"$limit": limit})
+        pipeline.append({"$project": binary_fields})
+
+        yield from self.faces_collection.aggregate(
+            pipeline, batchSize=METADATA_BATCH_SIZE
+        )
+
     # ------------------------------------------------------------------
     def find_known_persons(self, names: List[str]) -> List[Dict[str, Any]]:
         """Return documents containing ANY name from a list."""
         logger.info("Searching for documents containing any of %s", names)
 
         query = {"matched_persons": {"$in": names}}
-        cursor = self.faces_collection.find(query)
+        cursor = self.faces_collection.find(query, batch_size=200)
         results = list(cursor)
 
         logger.info("Found %d documents containing any of %s", len(results), names)
         return results
 
     # ------------------------------------------------------------------
+    def _known_faces_version(self) -> Tuple[int, Any]:
+        """Return a cheap (count, newest _id) probe of the known-faces collection."""
+        last = self.known_faces_collection.find_one(
+            {}, projection={"_id": 1}, sort=[("_id", -1)]
+        )
+        return (
+            self.known_faces_collection.estimated_document_count(),
+            last["_id"] if last else None,
+        )
+
     def get_all_known_faces(self) -> List[Dict[str, Any]]:
-        """Return all known face documents."""
+        """
+        Return all known face documents.
+
+        Results are cached until the collection's count or newest _id changes,
+        or KNOWN_FACES_CACHE_TTL seconds pass.
+        """
+        version = self._known_faces_version()
+        if self._known_cache is not None:
+            cached_version, loaded_at, cached = self._known_cache
+            if (
+                cached_version == version
+                and time.monotonic() - loaded_at < settings.known_faces_cache_ttl
+            ):
+                logger.info("Returning %d cached known face entries", len(cached))
+                return list(cached)
+
         logger.info("Fetching all known faces")
-        cursor = self.known_faces_collection.find()
+        # Known faces carry image bytes; smaller batches bound per-reply memory
+        cursor = self.known_faces_collection.find(batch_size=100)
         results = list(cursor)
+        self._known_cache = (version, time.monotonic(), results)
 
         logger.info("Found %d known face entries", len(results))
-        return results
+        return list(results)
 
     # ------------------------------------------------------------------
     def photos_detected_faces(self) -> List[Dict[str, Any]]:
@@ -116,6 +251,7 @@ class FaceSearcher:
                 "face_count": 1,
                 "matched_persons": 1,
             },
+            batch_size=METADATA_BATCH_SIZE,
         ).sort("bsonTime", -1)
 
         results = list(cursor)
@@ -123,13 +259,22 @@ class FaceSearcher:
         return results
 
     # ------------------------------------------------------------------
-    def get_latest_cctv_entry(self) -> Optional[Dict[str, Any]]:
-        """Return the most recent CCTV entry."""
+    def get_latest_cctv_entry(
+        self, projection: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Return the most recent CCTV entry.
+
+        Only identifying metadata is returned by default; callers that need the
+        image should call get_photo_image(filename) afterwards.
+        """
         logger.info("Fetching latest CCTV entry")
 
         doc = cast(
             Optional[Dict[str, Any]],
-            self.photos_collection.find_one(sort=[("date", -1)]),
+            self.photos_collection.find_one(
+                projection=projection or latest_cctv_fields, sort=[("date", -1)]
+            ),
         )
 
         if doc:
@@ -141,27 +286,77 @@ class FaceSearcher:
 
     # ------------------------------------------------------------------
     def get_known_face_image(self, name: str) -> Optional[Dict[str, Any]]:
-        """Return the FULL known face document including binary image."""
-        logger.info("Fetching known face image for: %s", name)
+        """Return the image fields of a known face document by name."""
+        logger.debug("Fetching known face image for: %s", name)
         return cast(
             Optional[Dict[str, Any]],
-            self.known_faces_collection.find_one({"name": name}),
+            self.known_faces_collection.find_one({"name": name}, image_fields),
         )
 
     # ------------------------------------------------------------------
     def get_face_image(self, filename: str) -> Optional[Dict[str, Any]]:
-        """Return a single face document including binary image."""
-        logger.info("Fetching face image for: %s", filename)
+        """Return the image fields of a single face document by filename."""
+        logger.debug("Fetching face image for: %s", filename)
         return cast(
             Optional[Dict[str, Any]],
-            self.faces_collection.find_one({"filename": filename}),
+            self.faces_collection.find_one({"filename": filename}, image_fields),
         )
 
     # ------------------------------------------------------------------
     def get_photo_image(self, filename: str) -> Optional[Dict[str, Any]]:
-        """Return a CCTV photo document including binary image."""
-        logger.info("Fetching CCTV photo image for: %s", filename)
-        return cast(
+        """
+        Return the image fields of a CCTV photo document by filename.
+
+        Found documents are cached for PHOTO_IMAGE_CACHE_TTL seconds, within
+        PHOTO_IMAGE_CACHE_BYTES of image data in total.
+        """
+        cached = self._photo_image_cache.get(filename, settings.photo_image_cache_ttl)
+        if cached is not None:
+            return cached
+
+        logger.debug("Fetching CCTV photo image for: %s", filename)
+        doc = cast(
             Optional[Dict[str, Any]],
-            self.photos_collection.find_one({"filename": filename}),
+            self.photos_collection.find_one({"filename": filename}, image_fields),
         )
+        if doc is not None:
+            self._photo_image_cache.put(filename, doc)
+        return doc
+
+    # ------------------------------------------------------------------
+    def get_known_face_images(self, names: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Return the image fields of known face documents keyed by name."""
+        return self._find_by_field(self.known_faces_collection, "name", names)
+
+    # ------------------------------------------------------------------
+    def get_face_images(self, filenames: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Return the image fields of face documents keyed by filename."""
+        return self._find_by_field(self.faces_collection, "filename", filenames)
+
+    # ------------------------------------------------------------------
+    def get_photo_images(self, filenames: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Return the image fields of CCTV photo documents keyed by filename."""
+        return self._find_by_field(self.photos_collection, "filename", filenames)
+
+    @staticmethod
+    def _find_by_field(
+        collection: Collection, field: str, values: List[str]
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Fetch the image fields of documents whose ``field`` is in ``values``.
+
+        Values are looked up in chunks of IN_QUERY_CHUNK so each query stays on
+        the field index. Like find_one, only the first document per value is kept.
+        """
+        unique = list(dict.fromkeys(values))
+        logger.info("Fetching %d documents by %s", len(unique), field)
+
+        found: Dict[str, Dict[str, Any]] = {}
+        for start in range(0, len(unique), IN_QUERY_CHUNK):
+            chunk = unique[start : start + IN_QUERY_CHUNK]
+            cursor = collection.find(
+                {field: {"$in": chunk}}, {**image_fields, field: 1}, batch_size=500
+            )
+            for doc in cursor:
+                found.setdefault(doc[field], doc)
+        return found
@@ -0,0 +1,107 @@
+"""migrations.py - One-off data migrations for the MongoDB collections.
+
+Run with ``python -m app.migrations [--dry-run]``.
+"""
+
+import argparse
+import base64
+import logging
+from typing import Any, Dict, List, Optional
+from bson.binary import Binary
+from pymongo import UpdateOne
+from pymongo.collection import Collection
+from app.db import close_mongo_client, get_mongo_collections
+
+logger = logging.getLogger(__name__)
+
+# Fields the image endpoints read JPEG bytes from
+IMAGE_FIELDS = ("image", "data")
+
+# Documents rewritten per bulk_write round trip
+MIGRATION_BATCH_SIZE = 500
+
+
+def _decode_stored_image(value: Any) -> Optional[bytes]:
+    """
+    Return the JPEG bytes of a base64-encoded value, or None if it is not a string.
+
+    Decoding is strict: anything besides whitespace outside the base64
+    alphabet (data URLs, paths, ...) raises ValueError instead of being
+    silently dropped.
+    """
+    if isinstance(value, dict) and "$binary" in value:
+        value = value["$binary"].get("base64")
+    if isinstance(value, str):
+        return base64.b64decode("".join(value.split()), validate=True)
+    return None
+
+
+def migrate_image_fields(collection: Collection, dry_run: bool = False) -> int:
+    """
+    Rewrite base64 string image fields as BSON Binary so they are served verbatim.
+
+    Returns the number of documents that were (or, with ``dry_run``, would be)
+    updated. Values that are not valid base64 are logged and left untouched;
+    their count is reported in both modes.
+    """
+    query = {
+        "$or": [{field: {"$type": ["string", "object"]}} for field in IMAGE_FIELDS]
+    }
+    projection = {field: 1 for field in IMAGE_FIELDS}
+
+    migrated = 0
+    skipped = 0
+    ops: List[UpdateOne] = []
+    for doc in collection.find(query, projection, batch_size=MIGRATION_BATCH_SIZE):
+        update: Dict[str, Binary] = {}
+        for field in IMAGE_FIELDS:
+            try:
+                raw = _decode_stored_image(doc.get(field))
+            except ValueError as e:
+                logger.warning("Skipping %s of %s: %s", field, doc["_id"], e)
+                skipped += 1
+                continue
+            if raw is not None:
+                update[field] = Binary(raw)
+
+        if not update:
+            continue
+        migrated += 1
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": update}))
+        if len(ops) == MIGRATION_BATCH_SIZE:
+            if not dry_run:
+                collection.bulk_write(ops, ordered=False)
+            ops = []
+
+    if ops and not dry_run:
+        collection.bulk_write(ops, ordered=False)
+
+    logger.info(
+        "%s %d documents in '%s', %s %d values that are not valid base64",
+        "Would migrate" if dry_run else "Migrated",
+        migrated,
+        collection.name,
+        "would skip" if dry_run else "skipped",
+        skipped,
+    )
+    return migrated
+
+
+def main() -> None:
+    """Convert base64 image fields to BSON Binary in all image collections."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument(
+        "--dry-run", action="store_true", help="count documents without writing"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    try:
+        for collection in get_mongo_collections():
+            migrate_image_fields(collection, dry_run=args.dry_run)
+    finally:
+        close_mongo_client()
+
+
+if __name__ == "__main__":
+    main()
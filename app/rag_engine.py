@@ -1,76 +1,486 @@
 """rag_engine.py - Local embedding-based similarity search using photo input."""
 
-from typing import Any, Dict, List, cast
+from typing import (
+    Any,
+    BinaryIO,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+    cast,
+)
+import logging
+import threading
 import numpy as np
+from bson.binary import Binary, BinaryVectorDtype
 from pymongo.collection import Collection
-from sklearn.metrics.pairwise import cosine_similarity
+from pymongo.errors import OperationFailure, PyMongoError
+from pymongo.operations import SearchIndexModel
+from app.config import settings
 from app.db import get_mongo_collections
+from app.face_search import binary_fields
+from app._simkernel import cosine_scores
 from app.utils import to_jsonable
+from app.utils.vector_utils import NDArrayFloat, as_embedding, normalize_rows
+from app.vector_index import PhotoVectorIndex
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_PATH = "search_embeddings.face_embedding"
+# Number of embeddings scored per matrix product (and the cursor batch size)
+SEARCH_CHUNK_SIZE = 4096
+
+# Returned photos skip image blobs and the stored embedding
+result_fields = {**binary_fields, EMBEDDING_PATH: 0}
 
 
 class RAGEngine:
     """Embedding-based face similarity search engine."""
 
-    def __init__(self, faces_collection: Collection | None = None) -> None:
-        """Initialize the RAGEngine with a MongoDB faces collection."""
+    def __init__(
+        self,
+        faces_collection: Collection | None = None,
+        known_faces_collection: Collection | None = None,
+    ) -> None:
+        """Initialize the RAGEngine with MongoDB faces and known faces collections."""
         if faces_collection is None:
-            faces_collection, _, _ = get_mongo_collections()  # ✅ fixed unpacking
+            faces_collection, default_known, _ = get_mongo_collections()
+            if known_faces_collection is None:
+                known_faces_collection = default_known
+        elif known_faces_collection is None:
+            # Known faces live in the same database as the faces collection
+            known_faces_collection = faces_collection.database[
+                settings.known_faces_collection
+            ]
         self.faces_collection: Collection = faces_collection
+        self.known_faces_collection: Collection = known_faces_collection
+        # Slim embedding-only copy of the faces collection, keyed by the photo _id
+        self.vectors_collection: Optional[Collection] = (
+            faces_collection.database[settings.face_vectors_collection]
+            if settings.face_vectors_collection
+            else None
+        )
+        # Newest photo _id already copied into vectors_collection
+        self._synced_id: Any = None
+        self._photo_index: Optional[PhotoVectorIndex] = None
+        self._photo_index_key: Optional[Tuple[int, Any]] = None
+        # Serializes refreshes so concurrent searches don't load the same rows
+        self._photo_index_lock = threading.Lock()
+
+    def _generate_embedding(self, image_bytes: bytes) -> NDArrayFloat:
+        """Convert uploaded photo to a deterministic unit-length embedding (stub)."""
+        # A local generator leaves the global NumPy RNG state untouched
+        rng = np.random.default_rng(len(image_bytes) % 1000)
+        embedding = rng.random(settings.embedding_dim, dtype=np.float32)
+        embedding /= np.linalg.norm(embedding)
+        return embedding
+
+    def warm_up(self) -> None:
+        """Prepare search state before serving: Atlas index, face_vectors copy, ANN index."""
+        self.ensure_vector_search_index()
+        self.sync_face_vectors()
+        if settings.ann_index and not settings.vector_search_index:
+            self._get_photo_index()
+
+    def ensure_vector_search_index(self) -> None:
+        """Create the Atlas Vector Search index on face embeddings if it is missing."""
+        if not settings.vector_search_index:
+            return
+
+        field: Dict[str, Any] = {
+            "type": "vector",
+            "path": EMBEDDING_PATH,
+            "numDimensions": settings.embedding_dim,
+            "similarity": "cosine",
+        }
+        if settings.vector_search_quantization:
+            # Atlas quantizes the indexed vectors server-side (int8 or 1-bit)
+            field["quantization"] = settings.vector_search_quantization
+
+        try:
+            existing = list(
+                self.faces_collection.list_search_indexes(settings.vector_search_index)
+            )
+            if existing:
+                return
+
+            self.faces_collection.create_search_index(
+                SearchIndexModel(
+                    name=settings.vector_search_index,
+                    type="vectorSearch",
+                    definition={"fields": [field]},
+                )
+            )
+            logger.info(
+                "Created vector search index '%s'", settings.vector_search_index
+            )
+        except OperationFailure as e:
+            logger.warning("Could not create vector search index: %s", e)
+
+    def _vector_search(
+        self, query_vec: NDArrayFloat, threshold: float
+    ) -> List[Dict[str, Any]]:
+        """Run the similarity search server-side with Atlas `$vectorSearch`."""
+        pipeline: List[Dict[str, Any]] = [
+            {
+                "$vectorSearch": {
+                    "index": settings.vector_search_index,
+                    "path": EMBEDDING_PATH,
+                    # Sent as a packed BSON float32 vector instead of a double array
+                    "queryVector": Binary.from_vector(
+                        query_vec.tolist(), BinaryVectorDtype.FLOAT32
+                    ),
+                    "numCandidates": settings.vector_search_limit * 20,
+                    "limit": settings.vector_search_limit,
+                }
+            },
+            # Atlas reports cosine as (1 + cos) / 2; map it back to [-1, 1]
+            {
+                "$set": {
+                    "similarity": {
+                        "$subtract": [
+                            {"$multiply": [{"$meta": "vectorSearchScore"}, 2]},
+                            1,
+                        ]
+                    }
+                }
+            },
+            {"$match": {"similarity": {"$gte": threshold}}},
+            {"$project": result_fields},
+        ]
+        results = list(self.faces_collection.aggregate(pipeline))
+        return cast(List[Dict[str, Any]], to_jsonable(results))
+
+    @staticmethod
+    def _newest_id(collection: Collection) -> Any:
+        """Return the largest _id in ``collection``, or None when it is empty."""
+        last = collection.find_one({}, projection={"_id": 1}, sort=[("_id", -1)])
+        return last["_id"] if last else None
+
+    def sync_face_vectors(self) -> None:
+        """
+        Copy embeddings of photos added since the last sync into face_vectors.
+
+        The copy runs server-side with `$merge` and only covers photos whose
+        _id is newer than the newest one already in face_vectors, so it is
+        cheap to repeat. Embeddings changed in place on older photos are not
+        picked up. MongoDB errors are logged and the existing copy is used.
+        """
+        if self.vectors_collection is None:
+            return
 
-    def _generate_embedding(
-        self, image_bytes: bytes
-    ) -> np.ndarray[Any, np.dtype[np.float32]]:
-        """Convert uploaded photo to a deterministic embedding vector (stub)."""
-        np.random.seed(len(image_bytes) % 1000)
-        return np.random.rand(128).astype(np.float32)
+        try:
+            newest = self._newest_id(self.faces_collection)
+            if newest is None or newest == self._synced_id:
+                return
 
-    def _calculate_similarity(
+            query: Dict[str, Any] = {EMBEDDING_PATH: {"$exists": True}}
+            last_copied = self._newest_id(self.vectors_collection)
+            if last_copied is not None:
+                query["_id"] = {"$gt": last_copied}
+
+            self.faces_collection.aggregate(
+                [
+                    {"$match": query},
+                    {"$project": {"embedding": f"${EMBEDDING_PATH}"}},
+                    {
+                        "$merge": {
+                            "into": self.vectors_collection.name,
+                            "whenMatched": "replace",
+                            "whenNotMatched": "insert",
+                        }
+                    },
+                ]
+            )
+        except PyMongoError as e:
+            logger.warning("Could not sync face vectors: %s", e)
+            return
+
+        self._synced_id = newest
+        logger.info("Synced face vectors into '%s'", self.vectors_collection.name)
+
+    def _embedding_source(self) -> Tuple[Collection, str]:
+        """Return the collection and embedding path to scan, syncing face_vectors first."""
+        if self.vectors_collection is not None:
+            self.sync_face_vectors()
+            return self.vectors_collection, "embedding"
+        return self.faces_collection, EMBEDDING_PATH
+
+    @staticmethod
+    def _decode_embedding(
+        doc: Dict[str, Any], keys: Sequence[str], dim: int
+    ) -> Optional[NDArrayFloat]:
+        """Return the float32 embedding stored under the nested ``keys``, or None."""
+        value: Any = doc
+        for key in keys:
+            value = value.get(key) if isinstance(value, dict) else None
+        return as_embedding(value, dim)
+
+    def _fetch_matches(self, matched: Dict[Any, float]) -> List[Dict[str, Any]]:
+        """Fetch photo documents for matched _ids, best similarity first."""
+        if not matched:
+            return []
+
+        cursor = self.faces_collection.find(
+            {"_id": {"$in": list(matched)}}, result_fields
+        )
+        results = [self._with_similarity(doc, matched[doc["_id"]]) for doc in cursor]
+        results.sort(key=lambda d: d["similarity"], reverse=True)
+        return results
+
+    def _fetch_grouped(
+        self, hits: Dict[str, Dict[Any, float]]
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """Fetch the union of matched photos once and regroup them per name."""
+        ids = {doc_id for matched in hits.values() for doc_id in matched}
+        full_docs = {
+            doc["_id"]: doc
+            for doc in (
+                self.faces_collection.find({"_id": {"$in": list(ids)}}, result_fields)
+                if ids
+                else []
+            )
+        }
+
+        grouped: Dict[str, List[Dict[str, Any]]] = {}
+        for name, matched in hits.items():
+            docs = [
+                self._with_similarity(full_docs[doc_id], similarity)
+                for doc_id, similarity in matched.items()
+                if doc_id in full_docs
+            ]
+            docs.sort(key=lambda d: d["similarity"], reverse=True)
+            grouped[name] = docs
+        return grouped
+
+    def _get_photo_index(self) -> PhotoVectorIndex:
+        """Return the cached photo index, refreshing it when the collection changed."""
+        collection, path = self._embedding_source()
+        key = (collection.estimated_document_count(), self._newest_id(collection))
+        if self._photo_index is not None and key == self._photo_index_key:
+            return self._photo_index
+
+        with self._photo_index_lock:
+            index, old_key = self._photo_index, self._photo_index_key
+            if index is not None and key == old_key:
+                return index
+            # Rows are bounded by the probed newest _id so that documents inserted
+            # while loading are picked up by the next refresh, not indexed twice
+            bound = {"$lte": key[1]} if key[1] is not None else {}
+            if (
+                index is not None
+                and old_key is not None
+                and old_key[1] is not None
+                and key[0] >= old_key[0]
+            ):
+                # Photos were only added since the last refresh: index just those
+                ids, matrix = self._load_embeddings(
+                    collection, path, {"$gt": old_key[1], **bound}, key[0] - old_key[0]
+                )
+                index.add(ids, matrix)
+            else:
+                ids, matrix = self._load_embeddings(collection, path, bound, key[0])
+                index = PhotoVectorIndex(ids, matrix, quantize=settings.ann_quantize)
+                self._photo_index = index
+            self._photo_index_key = key
+            return index
+
+    def _load_embeddings(
         self,
-        vec1: np.ndarray[Any, np.dtype[np.float32]],
-        vec2: np.ndarray[Any, np.dtype[np.float32]],
-    ) -> float:
-        """Compute cosine similarity between two embeddings."""
-        return float(cosine_similarity(vec1.reshape(1, -1), vec2.reshape(1, -1))[0][0])
+        collection: Collection,
+        path: str,
+        id_range: Dict[str, Any],
+        expected: int,
+    ) -> Tuple[List[Any], NDArrayFloat]:
+        """Decode the embeddings of documents whose _id is in ``id_range``."""
+        query: Dict[str, Any] = {path: {"$exists": True}}
+        if id_range:
+            query["_id"] = id_range
+
+        # Rows are decoded straight into one matrix sized from the count estimate
+        ids: List[Any] = []
+        matrix = np.empty((max(expected, 1), settings.embedding_dim), dtype=np.float32)
+        cursor = collection.find(query, {path: 1}, batch_size=SEARCH_CHUNK_SIZE)
+        keys = path.split(".")
+        for doc in cursor:
+            face_vec = self._decode_embedding(doc, keys, settings.embedding_dim)
+            if face_vec is None:
+                continue
+            if len(ids) == len(matrix):
+                # The estimate was low; grow geometrically
+                grown = np.empty((2 * len(matrix), matrix.shape[1]), dtype=np.float32)
+                grown[: len(ids)] = matrix
+                matrix = grown
+            matrix[len(ids)] = face_vec
+            ids.append(doc["_id"])
+
+        matrix = matrix[: len(ids)]
+        if matrix.base is not None and 4 * len(ids) < 3 * len(matrix.base):
+            # Release the unused tail when many documents lacked an embedding
+            matrix = matrix.copy()
+        return ids, matrix
+
+    def _index_search(
+        self, query_vec: NDArrayFloat, threshold: float
+    ) -> List[Dict[str, Any]]:
+        """Search the in-process photo index and fetch the matching documents."""
+        index = self._get_photo_index()
+        positions, similarities = index.search(query_vec, settings.ann_top_k)
+
+        matched = {
+            index.ids[pos]: float(sim)
+            for pos, sim in zip(positions, similarities)
+            if sim >= threshold
+        }
+        return self._fetch_matches(matched)
+
+    def _iter_embedding_chunks(
+        self, dim: int
+    ) -> Iterator[Tuple[List[Any], NDArrayFloat]]:
+        """
+        Stream stored face embeddings as (_id list, matrix) chunks.
+
+        The cursor is consumed in chunks of SEARCH_CHUNK_SIZE so BSON decode
+        overlaps with the math and peak memory stays bounded by one chunk.
+        Rows are copied unnormalized into one reusable buffer for
+        cosine_scores. The yielded matrix is only valid until the next chunk
+        is requested.
+
+        Only _id and the embedding are projected, so the scan moves no photo
+        metadata; callers load full documents for the matches afterwards.
+        When the slim face_vectors collection is configured it is scanned
+        instead.
+        """
+        collection, path = self._embedding_source()
+        cursor = collection.find(
+            {path: {"$exists": True}}, {path: 1}, batch_size=SEARCH_CHUNK_SIZE
+        )
+
+        ids: List[Any] = []
+        buffer = np.empty((SEARCH_CHUNK_SIZE, dim), dtype=np.float32)
+
+        keys = path.split(".")
+        for doc in cursor:
+            face_vec = self._decode_embedding(doc, keys, dim)
+            if face_vec is None:
+                continue
+
+            np.copyto(buffer[len(ids)], face_vec)
+            ids.append(doc["_id"])
+
+            if len(ids) == SEARCH_CHUNK_SIZE:
+                yield ids, buffer
+                ids = []
+
+        if ids:
+            yield ids, buffer[: len(ids)]
+
+    @staticmethod
+    def _with_similarity(doc: Dict[str, Any], similarity: float) -> Dict[str, Any]:
+        """Return a JSON-safe copy of ``doc`` enriched with its similarity score."""
+        enriched_doc: Dict[str, Any] = to_jsonable(doc)
+        enriched_doc["similarity"] = similarity
+        return enriched_doc
 
     def search_by_photo(
-        self, image_bytes: bytes, threshold: float = 0.8
+        self, image: Union[bytes, BinaryIO], threshold: float = 0.8
     ) -> List[Dict[str, Any]]:
         """
         Search for similar faces in MongoDB based on photo embedding similarity.
 
+        When VECTOR_SEARCH_INDEX is configured the search runs server-side via
+        Atlas `$vectorSearch` and returns at most VECTOR_SEARCH_LIMIT matches.
+        With ANN_INDEX enabled it queries a cached in-process index and returns
+        at most ANN_TOP_K matches. Otherwise the stored embeddings are streamed
+        in chunks and each chunk is scored in a single cosine_scores call.
+
         Args:
-            image_bytes: Uploaded image file content (bytes).
+            image: Uploaded image content, as bytes or a binary file object.
+                A file is read here, so callers running this in a worker
+                thread keep the copy off the event loop.
             threshold: Minimum similarity value to include in results.
 
         Returns:
             A list of MongoDB documents (faces) that match the given photo,
             each enriched with a "similarity" field.
         """
+        image_bytes = image if isinstance(image, bytes) else image.read()
         if not image_bytes:
             return []
 
         query_vec = self._generate_embedding(image_bytes)
-        cursor = self.faces_collection.find(
-            {"search_embeddings.face_embedding": {"$exists": True}}
+        if settings.vector_search_index:
+            return self._vector_search(query_vec, threshold)
+        if settings.ann_index:
+            return self._index_search(query_vec, threshold)
+
+        matched: Dict[Any, float] = {}
+        queries = query_vec.reshape(1, -1)
+        for ids, matrix in self._iter_embedding_chunks(query_vec.shape[0]):
+            similarities = cosine_scores(matrix, queries)[:, 0]
+            for idx in np.flatnonzero(similarities >= threshold):
+                matched[ids[idx]] = float(similarities[idx])
+
+        # The scan only carried ids; load the matched photo documents once
+        return self._fetch_matches(matched)
+
+    def find_photos_with_people(
+        self, names: List[str], threshold: float = 0.8
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Find photos whose face embedding matches any of the given known persons.
+
+        The known embeddings are fetched with one `$in` query and the photo
+        embeddings are scanned once, scoring every chunk against all persons
+        in a single cosine_scores call. With ANN_INDEX enabled the cached photo
+        matrix is scored exactly with one GEMM instead of rescanning MongoDB.
+
+        Args:
+            names: Known person names to look for.
+            threshold: Minimum similarity value to include in results.
+
+        Returns:
+            A mapping of each requested name to its matching photo documents,
+            each enriched with a "similarity" field. Names without a stored
+            embedding map to an empty list.
+        """
+        results: Dict[str, List[Dict[str, Any]]] = {name: [] for name in names}
+        if not names:
+            return results
+
+        persons: List[str] = []
+        person_vecs: List[NDArrayFloat] = []
+        cursor = self.known_faces_collection.find(
+            {"name": {"$in": names}}, {"name": 1, "embedding": 1}
         )
+        for known in cursor:
+            person_vec = as_embedding(known.get("embedding"), settings.embedding_dim)
+            if person_vec is not None and known.get("name") in results:
+                persons.append(known["name"])
+                person_vecs.append(person_vec)
 
-        results: List[Dict[str, Any]] = []
+        if not persons:
+            return results
 
-        for doc in cursor:
-            emb_data = doc.get("search_embeddings", {}).get("face_embedding")
-            if not emb_data:
-                continue
+        persons_mat = normalize_rows(np.stack(person_vecs))
 
-            try:
-                face_vec = np.frombuffer(emb_data, dtype=np.float32)
-                similarity = self._calculate_similarity(query_vec, face_vec)
-            except Exception:
-                continue
+        hits: Dict[str, Dict[Any, float]] = {name: {} for name in names}
 
-            if similarity >= threshold:
-                enriched_doc = dict(doc)
-                enriched_doc["similarity"] = similarity
-                results.append(enriched_doc)
+        if settings.ann_index:
+            # Score the cached normalized photo matrix instead of rescanning Mongo
+            index = self._get_photo_index()
+            similarities = index.scores(persons_mat)
+            for row, col in zip(*np.nonzero(similarities >= threshold)):
+                hits[persons[col]][index.ids[row]] = float(similarities[row, col])
+            return self._fetch_grouped(hits)
 
-        # ✅ Explicit cast ensures correct static typing for mypy
-        return cast(List[Dict[str, Any]], to_jsonable(results))
+        for ids, matrix in self._iter_embedding_chunks(settings.embedding_dim):
+            similarities = cosine_scores(matrix, persons_mat)
+            for row, col in zip(*np.nonzero(similarities >= threshold)):
+                hits[persons[col]][ids[row]] = float(similarities[row, col])
+
+        # The scan only carried ids; load the matched photo documents once
+        return self._fetch_grouped(hits)
@@ -0,0 +1,50 @@
+"""responses.py - orjson-backed JSON and NDJSON encoding for the API routes."""
+
+from typing import Any, Iterable, Iterator, List
+import base64
+import orjson
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+
+
+def _encode_bson(value: Any) -> Any:
+    """orjson ``default`` hook for the BSON types it does not encode natively."""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, bytes):
+        # Raw bytes (including bson Binary) are sent as base64, like to_jsonable
+        return base64.b64encode(value).decode("ascii")
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def ndjson_chunks(docs: Iterable[Any], batch_size: int) -> Iterator[bytes]:
+    """
+    Encode documents as newline-terminated JSON lines, ``batch_size`` per chunk.
+
+    Each chunk is one body write, so a streamed response pays the per-send
+    (and, for sync iterators, per-thread-hop) cost once per batch.
+    """
+    option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_APPEND_NEWLINE
+    lines: List[bytes] = []
+    for doc in docs:
+        lines.append(orjson.dumps(doc, default=_encode_bson, option=option))
+        if len(lines) == batch_size:
+            yield b"".join(lines)
+            lines = []
+    if lines:
+        yield b"".join(lines)
+
+
+class ORJSONResponse(JSONResponse):
+    """JSONResponse that renders with orjson instead of the stdlib json module."""
+
+    def render(self, content: Any) -> bytes:
+        """
+        Serialize ``content`` in one C pass over raw MongoDB documents.
+
+        datetime and NumPy values are encoded natively, ObjectId and bytes via
+        _encode_bson, so callers do not need to run to_jsonable first.
+        """
+        return orjson.dumps(
+            content, default=_encode_bson, option=orjson.OPT_SERIALIZE_NUMPY
+        )
@@ -5,9 +5,23 @@ from bson import ObjectId
 import base64
 from datetime import datetime
 
+# Types returned unchanged; checked by identity before any isinstance call
+_PASSTHROUGH_TYPES = frozenset({str, int, float, bool, type(None)})
+
 
 def to_jsonable(data: Any) -> Any:
     """Recursively convert MongoDB documents to JSON-serializable objects."""
+    data_type = type(data)
+    if data_type in _PASSTHROUGH_TYPES:
+        return data
+    if data_type is dict:
+        return {key: to_jsonable(value) for key, value in data.items()}
+    if data_type is list:
+        return [to_jsonable(item) for item in data]
+    if data_type is ObjectId:
+        return str(data)
+
+    # Subclasses (e.g. bson Binary is bytes) take the slower isinstance checks
     if isinstance(data, list):
         return [to_jsonable(item) for item in data]
     if isinstance(data, dict):
@@ -16,7 +30,7 @@ def to_jsonable(data: Any) -> Any:
         return str(data)
     if isinstance(data, bytes):
         # Convert raw bytes (e.g., embeddings or images) to base64 strings
-        return base64.b64encode(data).decode("utf-8")
+        return base64.b64encode(data).decode("ascii")
     if isinstance(data, datetime):
         # Convert datetime to ISO string
         return data.isoformat()
@@ -0,0 +1,74 @@
+"""cache.py - Small in-process LRU cache with per-entry expiry."""
+
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, Optional, Tuple, TypeVar
+import threading
+import time
+
+V = TypeVar("V")
+
+
+class TTLCache(Generic[V]):
+    """
+    Bounded LRU mapping whose entries expire a given number of seconds after insertion.
+
+    Safe to share between the threadpool workers that run the sync routes.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        max_bytes: Optional[int] = None,
+        sizeof: Optional[Callable[[V], int]] = None,
+    ) -> None:
+        """
+        Create an empty cache holding at most ``maxsize`` entries.
+
+        With ``max_bytes``, the ``sizeof`` of all entries is also kept within
+        that budget; a single value larger than the budget is not stored.
+        """
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._bytes = 0
+        # key -> (insert time, value, size), least recently used first
+        self._data: OrderedDict[Hashable, Tuple[float, V, int]] = OrderedDict()
+        # get() reorders entries, so reads need the lock as much as writes
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Return the number of stored (possibly expired) entries."""
+        return len(self._data)
+
+    def get(self, key: Hashable, ttl: float) -> Optional[V]:
+        """
+        Return the value for ``key`` if it was stored less than ``ttl`` seconds ago.
+
+        The TTL is passed per call so it can follow runtime settings.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] >= ttl:
+                del self._data[key]
+                self._bytes -= entry[2]
+                return None
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: Hashable, value: V) -> None:
+        """Store ``value`` and evict least recently used entries while over budget."""
+        size = self._sizeof(value) if self._sizeof is not None else 0
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._data[key] = (time.monotonic(), value, size)
+            self._bytes += size
+            while len(self._data) > self.maxsize or (
+                self.max_bytes is not None and self._bytes > self.max_bytes
+            ):
+                self._bytes -= self._data.popitem(last=False)[1][2]
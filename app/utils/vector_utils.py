@@ -1,8 +1,10 @@
 """Utility functions for vector math operations."""
 
 from __future__ import annotations
-from typing import Any
+from typing import Any, Optional
+import math
 import numpy as np
+from bson.binary import VECTOR_SUBTYPE, Binary, BinaryVectorDtype
 
 # Typed alias for float32 arrays
 NDArrayFloat = np.ndarray[Any, np.dtype[np.float32]]
@@ -10,14 +12,71 @@ NDArrayFloat = np.ndarray[Any, np.dtype[np.float32]]
 
 def cosine_similarity(vec1: NDArrayFloat, vec2: NDArrayFloat) -> float:
     """Compute cosine similarity between two vectors."""
-    if np.linalg.norm(vec1) == 0 or np.linalg.norm(vec2) == 0:
+    # Each norm is computed once; sqrt of a dot skips the np.linalg.norm wrapper
+    norm1 = math.sqrt(float(np.dot(vec1, vec1)))
+    norm2 = math.sqrt(float(np.dot(vec2, vec2)))
+    if norm1 == 0.0 or norm2 == 0.0:
         return 0.0
-    return float(np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2)))
+    return float(np.dot(vec1, vec2)) / (norm1 * norm2)
 
 
 def normalize_vector(vector: NDArrayFloat) -> NDArrayFloat:
     """Normalize a numpy vector to unit length."""
-    norm = np.linalg.norm(vector)
-    if norm == 0:
+    norm = math.sqrt(float(np.dot(vector, vector)))
+    if norm == 0.0:
         return vector
     return vector / norm
+
+
+def normalize_rows(matrix: NDArrayFloat) -> NDArrayFloat:
+    """L2-normalize every row of a matrix in place with a single norm call."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+
+def quantize_rows(
+    matrix: NDArrayFloat,
+) -> tuple[np.ndarray[Any, np.dtype[np.int8]], NDArrayFloat]:
+    """
+    Quantize each row to int8 with its own scale.
+
+    Returns the int8 codes and the per-row factor that maps codes back to
+    floats (``row ~= codes * factor``).
+    """
+    peaks = np.abs(matrix).max(axis=1)
+    peaks[peaks == 0] = 1.0
+    codes = np.round(matrix * (127.0 / peaks)[:, None]).astype(np.int8)
+    return codes, (peaks / 127.0).astype(np.float32)
+
+
+def as_embedding(raw: Any, dim: int) -> Optional[NDArrayFloat]:
+    """
+    Convert a stored embedding to a float32 vector.
+
+    Accepts BSON vectors (BinData subtype 9), raw float32 bytes, or a list of floats.
+
+    Returns None when the value is missing, malformed, or of another dimension,
+    so callers can skip the document instead of failing the whole batch.
+    """
+    if raw is None or len(raw) == 0:
+        return None
+
+    try:
+        if isinstance(raw, Binary) and raw.subtype == VECTOR_SUBTYPE:
+            if raw[:1] == BinaryVectorDtype.FLOAT32.value:
+                # Skip the 2-byte dtype/padding header and view the floats in place
+                vec = np.frombuffer(raw, dtype=np.float32, offset=2)
+            else:
+                vec = np.asarray(raw.as_vector().data, dtype=np.float32)
+        elif isinstance(raw, (bytes, bytearray, memoryview)):
+            vec = np.frombuffer(raw, dtype=np.float32)
+        else:
+            vec = np.asarray(raw, dtype=np.float32)
+    except (TypeError, ValueError):
+        return None
+
+    if vec.shape != (dim,):
+        return None
+    return vec
@@ -0,0 +1,166 @@
+"""vector_index.py - In-process nearest-neighbour index over photo face embeddings."""
+
+from typing import Any, List, Optional, Tuple, cast
+import logging
+import threading
+import numpy as np
+from app._simkernel import int8_dots, int8_kernel_available
+from app.utils.vector_utils import NDArrayFloat, normalize_rows, quantize_rows
+
+try:
+    import hnswlib
+except ImportError:  # pragma: no cover - optional dependency
+    hnswlib = None
+
+logger = logging.getLogger(__name__)
+
+NDArrayInt = np.ndarray[Any, np.dtype[np.int64]]
+NDArrayInt8 = np.ndarray[Any, np.dtype[np.int8]]
+
+# Below this many rows an exact scan is as fast as the graph and needs no build
+HNSW_MIN_ROWS = 10_000
+
+# Candidates taken from the int8 pass and re-scored exactly in float32
+RERANK_CANDIDATES = 50
+
+
+class PhotoVectorIndex:
+    """
+    Normalized embedding matrix with an HNSW graph on top for large galleries.
+
+    The graph is built when hnswlib is installed and there are at least
+    HNSW_MIN_ROWS embeddings; smaller indexes are searched exactly. Rows for
+    new documents are appended with add() instead of rebuilding.
+    """
+
+    def __init__(
+        self, ids: List[Any], vectors: NDArrayFloat, quantize: bool = False
+    ) -> None:
+        """
+        Build the index from document ids and their (N, D) embedding matrix.
+
+        A C-contiguous float32 ``vectors`` is normalized in place and kept
+        without a copy.
+
+        With ``quantize`` and no HNSW graph, int8 codes of the rows are kept so
+        brute-force searches read a quarter of the bytes per candidate.
+        """
+        self.ids = ids
+        self.vectors: NDArrayFloat = normalize_rows(
+            np.ascontiguousarray(vectors, dtype=np.float32)
+        )
+        self._hnsw: Any = None
+        # Serializes graph growth (add_items/resize_index) with graph queries
+        self._lock = threading.Lock()
+        if hnswlib is not None and len(ids) >= HNSW_MIN_ROWS:
+            self._build_hnsw()
+
+        # int8 codes and per-row scales, swapped together so readers see a pair
+        self._quantized: Optional[Tuple[NDArrayInt8, NDArrayFloat]] = None
+        if quantize and self._hnsw is None and int8_kernel_available():
+            self._quantized = quantize_rows(self.vectors)
+
+        logger.info(
+            "Built photo vector index with %d embeddings (hnsw=%s)",
+            len(ids),
+            self._hnsw is not None,
+        )
+
+    def _build_hnsw(self) -> None:
+        """Build the HNSW graph over all current rows."""
+        # Inner product on unit vectors is cosine similarity
+        hnsw = hnswlib.Index(space="ip", dim=self.vectors.shape[1])
+        hnsw.init_index(max_elements=len(self.ids), M=16, ef_construction=200)
+        hnsw.add_items(self.vectors, np.arange(len(self.ids)))
+        self._hnsw = hnsw
+
+    def add(self, ids: List[Any], vectors: NDArrayFloat) -> None:
+        """
+        Append rows for newly stored documents without rebuilding the index.
+
+        New rows are inserted into the HNSW graph, whose capacity grows
+        geometrically; a gallery crossing HNSW_MIN_ROWS gets its graph built
+        once. Ids are published before rows, so a concurrent search never
+        returns a position without an id.
+        """
+        if not ids:
+            return
+        rows = normalize_rows(np.ascontiguousarray(vectors, dtype=np.float32))
+        with self._lock:
+            start = len(self.ids)
+            self.ids = self.ids + list(ids)
+            self.vectors = np.concatenate([self.vectors, rows])
+            if self._hnsw is not None:
+                capacity = self._hnsw.get_max_elements()
+                if len(self.ids) > capacity:
+                    self._hnsw.resize_index(max(len(self.ids), 2 * capacity))
+                self._hnsw.add_items(rows, np.arange(start, len(self.ids)))
+            elif hnswlib is not None and len(self.ids) >= HNSW_MIN_ROWS:
+                self._build_hnsw()
+                self._quantized = None
+            elif self._quantized is not None:
+                codes, scales = quantize_rows(rows)
+                self._quantized = (
+                    np.concatenate([self._quantized[0], codes]),
+                    np.concatenate([self._quantized[1], scales]),
+                )
+        logger.info("Added %d embeddings to the photo vector index", len(ids))
+
+    def __len__(self) -> int:
+        """Return the number of indexed embeddings."""
+        return len(self.ids)
+
+    def scores(self, queries: NDArrayFloat) -> NDArrayFloat:
+        """Return the exact (N, K) cosine similarities to K unit query rows in one GEMM."""
+        result: NDArrayFloat = self.vectors @ queries.T
+        return result
+
+    def search(
+        self, query_vec: NDArrayFloat, k: int
+    ) -> Tuple[NDArrayInt, NDArrayFloat]:
+        """Return row positions and cosine similarities of the ``k`` nearest rows."""
+        empty = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        if self._hnsw is not None:
+            with self._lock:
+                k = min(k, self._hnsw.get_current_count())
+                if k == 0:
+                    return empty
+                self._hnsw.set_ef(max(k * 2, 50))
+                labels, distances = self._hnsw.knn_query(query_vec, k=k)
+            return labels[0].astype(np.int64), (1.0 - distances[0]).astype(np.float32)
+
+        quantized = self._quantized
+        if quantized is not None:
+            k = min(k, len(quantized[0]))
+            return self._search_quantized(query_vec, k, *quantized) if k else empty
+
+        # One snapshot of the rows; add() may swap in a longer matrix meanwhile
+        vectors = self.vectors
+        k = min(k, len(vectors))
+        if k == 0:
+            return empty
+        similarities = vectors @ query_vec
+        # O(N) selection of the top k, then sort only those k
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top])]
+        return cast(NDArrayInt, top), cast(NDArrayFloat, similarities[top])
+
+    def _search_quantized(
+        self,
+        query_vec: NDArrayFloat,
+        k: int,
+        codes: NDArrayInt8,
+        code_scales: NDArrayFloat,
+    ) -> Tuple[NDArrayInt, NDArrayFloat]:
+        """Pick candidates with the int8 kernel, then rerank them in float32."""
+        query_codes, query_scale = quantize_rows(query_vec.reshape(1, -1))
+        approx = int8_dots(codes, query_codes[0]) * code_scales * query_scale[0]
+
+        n_candidates = min(len(codes), max(k, RERANK_CANDIDATES))
+        candidates = np.argpartition(-approx, n_candidates - 1)[:n_candidates]
+        exact = self.vectors[candidates] @ query_vec
+        order = np.argsort(-exact)[:k]
+        return (
+            cast(NDArrayInt, candidates[order]),
+            cast(NDArrayFloat, exact[order]),
+        )
@@ -1,29 +1,118 @@
 """Main FastAPI application for local face recognition and search."""
 
-import base64
+import hashlib
 import logging
-from typing import List
-from urllib.parse import unquote
-from fastapi import FastAPI, UploadFile, File, HTTPException, Response
-from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote, unquote
+from anyio import create_task_group, to_thread
+from fastapi import (
+    FastAPI,
+    UploadFile,
+    File,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+)
 from fastapi.middleware.cors import CORSMiddleware
-from app.face_search import FaceSearcher
+from fastapi.responses import RedirectResponse, StreamingResponse
+from pymongo.errors import PyMongoError
+from starlette.concurrency import run_in_threadpool
+from app._simkernel import warm_up
+from app.clients.base_client import close_shared_client
+from app.config import settings
+from app.face_search import METADATA_BATCH_SIZE, FaceSearcher
 from app.rag_engine import RAGEngine
-from app.db import get_mongo_collections
-from app.utils import to_jsonable
+from app.responses import ORJSONResponse, ndjson_chunks
+from app.utils.cache import TTLCache
+from app.db import (
+    close_mongo_client,
+    ensure_indexes,
+    get_mongo_client,
+    get_mongo_collections,
+)
+
+try:
+    # SIMD base64 decoder; the stdlib C decoder is the fallback
+    from pybase64 import b64decode as _b64decode
+except ImportError:  # pragma: no cover - optional dependency
+    # base64.b64decode only wraps this; the stored images are trusted, and
+    # a2b_base64 already skips whitespace and other non-alphabet bytes
+    from binascii import a2b_base64 as _b64decode  # type: ignore[assignment]
 
 # ---------------------------------------------------------
 # Logging setup
 # ---------------------------------------------------------
 logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s"
+    level=settings.log_level.upper(),
+    format="%(asctime)s [%(levelname)s] %(message)s",
 )
 logger = logging.getLogger(__name__)
 
 # ---------------------------------------------------------
 # App initialization
 # ---------------------------------------------------------
-app = FastAPI(title="CCTV Face Recognition API", version="1.0.0")
+
+
+@lru_cache(maxsize=1)
+def get_searcher() -> FaceSearcher:
+    """Return the process-wide FaceSearcher over the shared MongoDB collections."""
+    return FaceSearcher(*get_mongo_collections())
+
+
+@lru_cache(maxsize=1)
+def get_engine() -> RAGEngine:
+    """Return the process-wide RAGEngine over the shared MongoDB collections."""
+    faces_collection, known_collection, _ = get_mongo_collections()
+    return RAGEngine(faces_collection, known_collection)
+
+
+def warm_up_mongo() -> None:
+    """
+    Open the connection pool, create indexes and preload the search state.
+
+    Every step is best effort: MongoDB errors are logged and the app starts
+    anyway, doing the remaining work lazily on the first requests.
+    """
+    try:
+        # Opens the pool's first connections before traffic arrives
+        get_mongo_client().admin.command("ping")
+    except PyMongoError as e:
+        logger.warning("MongoDB is not reachable at startup: %s", e)
+        return
+    try:
+        ensure_indexes(*get_mongo_collections())
+    except PyMongoError as e:
+        logger.warning("Could not ensure MongoDB indexes at startup: %s", e)
+    try:
+        get_engine().warm_up()
+    except PyMongoError as e:
+        logger.warning("Could not warm up the search engine: %s", e)
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI) -> AsyncIterator[None]:
+    """Warm up MongoDB and search state on startup; release shared resources on shutdown."""
+    # Sync routes block a worker thread on Mongo I/O; allow more of them in flight
+    to_thread.current_default_thread_limiter().total_tokens = settings.threadpool_size
+    # Blocking warm-ups run off the event loop and overlap; a failure cancels the other
+    async with create_task_group() as tg:
+        tg.start_soon(to_thread.run_sync, warm_up_mongo)
+        # Compile the similarity kernels before the first search request
+        tg.start_soon(to_thread.run_sync, warm_up, settings.embedding_dim)
+    yield
+    await close_shared_client()
+    close_mongo_client()
+
+
+app = FastAPI(
+    title="CCTV Face Recognition API",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 
 # ✅ Allow frontend (Render + local dev) via CORS
 origins = [
@@ -36,18 +125,15 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    # Only what the SPA sends; preflight answers are cached for a day
+    allow_methods=["GET", "POST"],
+    allow_headers=["content-type", "authorization", "if-none-match"],
+    max_age=86400,
 )
 
-# ---------------------------------------------------------
-# Initialize MongoDB + components
-# ---------------------------------------------------------
-faces_collection, known_collection, photos_collection = get_mongo_collections()
-searcher = FaceSearcher(faces_collection, known_collection, photos_collection)
-rag_engine = RAGEngine(faces_collection)
-
 UPLOAD_FILE_DEP = File(...)
+SKIP_QUERY = Query(0, ge=0)
+LIMIT_QUERY = Query(None, ge=1)
 
 # ---------------------------------------------------------
 # Routes
@@ -60,75 +146,134 @@ def health_check() -> dict[str, str]:
     return {"status": "ok"}
 
 
-@app.post("/faces/known")
-def find_known_faces(names: List[str]) -> JSONResponse:
-    """Find all photos containing one or more known persons."""
-    if not names:
-        raise HTTPException(status_code=400, detail="Name list cannot be empty")
+# Upper bound on names per request, so a single call has bounded cost
+MAX_NAMES = 200
 
-    found_results = []
-    seen_ids = set()
-    skipped_names = []
-
-    for name in names:
-        results = searcher.find_known_faces_by_name(name)
-        if results:
-            for doc in results:
-                doc_id = str(doc.get("_id"))
-                if doc_id not in seen_ids:
-                    found_results.append(doc)
-                    seen_ids.add(doc_id)
-        else:
-            skipped_names.append(name)
-
-    return JSONResponse(
-        {"results": to_jsonable(found_results), "skipped_names": skipped_names}
-    )
+
+def clean_names(names: List[str]) -> List[str]:
+    """Strip and deduplicate ``names`` in order; reject empty or oversized lists."""
+    if len(names) > MAX_NAMES:
+        raise HTTPException(
+            status_code=413, detail=f"At most {MAX_NAMES} names per request"
+        )
+    cleaned = list(dict.fromkeys(name.strip() for name in names if name.strip()))
+    if not cleaned:
+        raise HTTPException(status_code=400, detail="Name list cannot be empty")
+    return cleaned
 
 
-@app.get("/faces/unknown")
-def find_unknown_faces() -> JSONResponse:
-    """Find photos where some faces remain unidentified."""
-    results = searcher.find_unknown_faces()
-    return JSONResponse({"results": to_jsonable(results)})
+@app.post("/faces/known")
+def find_known_faces(names: List[str]) -> ORJSONResponse:
+    """Find all photos containing one or more known persons."""
+    names = clean_names(names)
+    results, found_names = get_searcher().find_known_faces_by_names(names)
+    skipped_names = [name for name in names if name not in found_names]
+
+    return ORJSONResponse({"results": results, "skipped_names": skipped_names})
+
+
+@app.post("/faces/known/similar")
+def find_similar_known_faces(
+    names: List[str], threshold: float = 0.8
+) -> ORJSONResponse:
+    """Find photos whose face embedding matches one or more known persons."""
+    names = clean_names(names)
+    results = get_engine().find_photos_with_people(names, threshold)
+    return ORJSONResponse({"results": results, "threshold": threshold})
+
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def accepted_media_types(header: str) -> Dict[str, float]:
+    """Parse an Accept header into a media range -> q-value mapping."""
+    accepted: Dict[str, float] = {}
+    for part in header.split(","):
+        media_range, *params = part.split(";")
+        media_range = media_range.strip().lower()
+        if not media_range:
+            continue
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[media_range] = quality
+    return accepted
+
+
+def prefers_ndjson(request: Request) -> bool:
+    """Return True if the client explicitly ranks NDJSON at least as high as JSON."""
+    accepted = accepted_media_types(request.headers.get("accept", ""))
+    ndjson_quality = accepted.get(NDJSON_MEDIA_TYPE, 0.0)
+    json_quality = max(
+        accepted.get(media_range, 0.0)
+        for media_range in ("application/json", "application/*", "*/*")
+    )
+    return ndjson_quality > 0 and ndjson_quality >= json_quality
+
+
+@app.get("/faces/unknown", response_model=None)
+def find_unknown_faces(
+    request: Request, skip: int = SKIP_QUERY, limit: Optional[int] = LIMIT_QUERY
+) -> ORJSONResponse | StreamingResponse:
+    """
+    Find photos where some faces remain unidentified, optionally one page at a time.
+
+    Clients that prefer application/x-ndjson get one document per line, streamed
+    a cursor batch at a time instead of after the whole result is built.
+    """
+    if prefers_ndjson(request):
+        docs = get_searcher().iter_unknown_faces(skip=skip, limit=limit)
+        return StreamingResponse(
+            ndjson_chunks(docs, METADATA_BATCH_SIZE), media_type=NDJSON_MEDIA_TYPE
+        )
+    results = get_searcher().find_unknown_faces(skip=skip, limit=limit)
+    return ORJSONResponse({"results": results})
 
 
 @app.post("/faces/search")
 async def find_person_from_photo(
     file: UploadFile = UPLOAD_FILE_DEP,
     threshold: float = 0.8,
-) -> JSONResponse:
+) -> ORJSONResponse:
     """Upload a photo and search for similar faces."""
     try:
-        contents = await file.read()
-        results = rag_engine.search_by_photo(contents, threshold)
-        return JSONResponse({"results": results, "threshold": threshold})
+        # The spooled upload is read and scanned in a worker thread, so neither
+        # the copy nor the blocking Mongo scan runs on the event loop
+        results = await run_in_threadpool(
+            get_engine().search_by_photo, file.file, threshold
+        )
+        return ORJSONResponse({"results": results, "threshold": threshold})
     except Exception as e:
         logger.error("Error processing photo search: %s", e)
         raise HTTPException(status_code=500, detail=str(e)) from e
 
 
 @app.get("/saved_known_faces")
-def get_saved_known_faces() -> JSONResponse:
+def get_saved_known_faces() -> ORJSONResponse:
     """Return all known faces."""
-    results = searcher.get_all_known_faces()
-    return JSONResponse({"results": to_jsonable(results)})
+    results = get_searcher().get_all_known_faces()
+    return ORJSONResponse({"results": results})
 
 
 @app.get("/photos_detected_faces")
-def photos_detected_faces() -> JSONResponse:
+def photos_detected_faces() -> ORJSONResponse:
     """Return lightweight list of detected faces (no images)."""
-    results = searcher.photos_detected_faces()
-    return JSONResponse({"results": to_jsonable(results)})
+    results = get_searcher().photos_detected_faces()
+    return ORJSONResponse({"results": results})
 
 
 @app.get("/current_cctv")
-def get_current_cctv() -> JSONResponse:
+def get_current_cctv() -> ORJSONResponse:
     """Return the most recent CCTV entry."""
-    latest = searcher.get_latest_cctv_entry()
+    latest = get_searcher().get_latest_cctv_entry()
     if not latest:
         raise HTTPException(status_code=404, detail="No CCTV entries found")
-    return JSONResponse({"result": to_jsonable(latest)})
+    return ORJSONResponse({"result": latest})
 
 
 # ---------------------------------------------------------
@@ -146,63 +291,135 @@ def decode_image_field(doc: dict) -> bytes:
     if isinstance(raw, bytes):
         return raw
     if isinstance(raw, dict) and "$binary" in raw:
-        return base64.b64decode(raw["$binary"]["base64"])
-    return base64.b64decode(raw)
+        return _b64decode(raw["$binary"]["base64"])
+    return _b64decode(raw)
 
 
-@app.get("/known_face_image/{name}")
-def get_known_face_image(name: str) -> Response:
-    """Return the image bytes for a known face by name."""
-    doc = searcher.get_known_face_image(name)
+def load_image_bytes(doc: Optional[dict], kind: str, key: str) -> bytes:
+    """Return the decoded image of ``doc``, raising 404 if missing and 500 if undecodable."""
     if not doc:
-        raise HTTPException(status_code=404, detail=f"No image found for {name}")
+        raise HTTPException(status_code=404, detail=f"No image found for {key}")
     try:
-        img_bytes = decode_image_field(doc)
-        return Response(content=img_bytes, media_type="image/jpeg")
+        return decode_image_field(doc)
     except Exception as e:
-        logger.error("Error decoding known face image for %s: %s", name, e)
+        logger.error("Error decoding %s for %s: %s", kind, key, e)
         raise HTTPException(status_code=500, detail=str(e)) from e
 
 
-@app.get("/face_image/{filename}")
-def get_face_image(filename: str) -> Response:
-    """Return the image bytes for a detected face by filename."""
-    decoded_filename = unquote(filename)
-    logger.info("Fetching face image for decoded filename: %s", decoded_filename)
+# Decoded JPEG bytes and their ETag per known name
+KNOWN_JPEG_CACHE_SIZE = 512
+_known_jpeg_cache: TTLCache[Tuple[bytes, str]] = TTLCache(KNOWN_JPEG_CACHE_SIZE)
 
-    doc = searcher.get_face_image(decoded_filename)
-    if not doc:
-        raise HTTPException(
-            status_code=404, detail=f"No image found for {decoded_filename}"
+
+def image_etag(img_bytes: bytes) -> str:
+    """Return a strong ETag for image bytes."""
+    return f'"{hashlib.blake2b(img_bytes, digest_size=8).hexdigest()}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Return True if the request's If-None-Match header covers ``etag``."""
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return "*" in tags or etag in tags
+
+
+def image_response(
+    request: Request, img_bytes: bytes, etag: str, cache_control: str
+) -> Response:
+    """Return the JPEG with validators, or an empty 304 if the client has it already."""
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=img_bytes, media_type="image/jpeg", headers=headers)
+
+
+@app.get("/known_face_image/{name}")
+def get_known_face_image(name: str, request: Request) -> Response:
+    """Return the image bytes for a known face by name."""
+    ttl = settings.known_face_image_cache_ttl
+    cached = _known_jpeg_cache.get(name, ttl)
+    if cached is None:
+        doc = get_searcher().get_known_face_image(name)
+        img_bytes = load_image_bytes(doc, "known face image", name)
+        cached = (img_bytes, image_etag(img_bytes))
+        _known_jpeg_cache.put(name, cached)
+
+    img_bytes, etag = cached
+    return image_response(request, img_bytes, etag, f"public, max-age={int(ttl)}")
+
+
+# Object-store path per image collection, so equal filenames never share a URL
+FACE_IMAGE_PREFIX = "faces"
+PHOTO_IMAGE_PREFIX = "photos"
+
+
+def image_redirect(prefix: str, filename: str) -> Optional[RedirectResponse]:
+    """Return a redirect to IMAGE_BASE_URL/<prefix>/<filename> when it is configured."""
+    if not settings.image_base_url:
+        return None
+    url = f"{settings.image_base_url.rstrip('/')}/{prefix}/{quote(filename)}"
+    return RedirectResponse(url=url, status_code=307)
+
+
+# Face crops and CCTV frames never change once stored under a filename
+IMMUTABLE_IMAGE_MAX_AGE = 86400
+IMMUTABLE_CACHE_CONTROL = f"public, max-age={IMMUTABLE_IMAGE_MAX_AGE}, immutable"
+
+# ETags of served filename images, so revalidations skip MongoDB entirely
+FILENAME_ETAG_CACHE_SIZE = 4096
+_filename_etags: TTLCache[str] = TTLCache(FILENAME_ETAG_CACHE_SIZE)
+
+
+def filename_image_response(
+    request: Request,
+    kind: str,
+    prefix: str,
+    filename: str,
+    fetch: Callable[[str], Optional[Dict[str, Any]]],
+) -> Response:
+    """Serve an immutable image by filename: redirect, 304, or the JPEG bytes."""
+    redirect = image_redirect(prefix, filename)
+    if redirect is not None:
+        return redirect
+
+    etag = _filename_etags.get((kind, filename), IMMUTABLE_IMAGE_MAX_AGE)
+    if etag is not None and etag_matches(request, etag):
+        return Response(
+            status_code=304,
+            headers={"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL},
         )
 
-    try:
-        img_bytes = decode_image_field(doc)
-        return Response(content=img_bytes, media_type="image/jpeg")
-    except Exception as e:
-        logger.error("Error decoding face image for %s: %s", decoded_filename, e)
-        raise HTTPException(
-            status_code=500, detail=str(e)
-        ) from e  # pylint: disable=raise-missing-from
+    img_bytes = load_image_bytes(fetch(filename), kind, filename)
+    etag = image_etag(img_bytes)
+    _filename_etags.put((kind, filename), etag)
+    return image_response(request, img_bytes, etag, IMMUTABLE_CACHE_CONTROL)
 
 
-@app.get("/photo_image/{filename}")
-def get_photo_image(filename: str) -> Response:
-    """Return the image bytes for a photo by filename."""
+@app.get("/face_image/{filename}")
+def get_face_image(filename: str, request: Request) -> Response:
+    """Return the image bytes for a detected face by filename."""
     decoded_filename = unquote(filename)
-    logger.info("Fetching photo image for decoded filename: %s", decoded_filename)
+    logger.debug("Fetching face image for decoded filename: %s", decoded_filename)
+    return filename_image_response(
+        request,
+        "face image",
+        FACE_IMAGE_PREFIX,
+        decoded_filename,
+        get_searcher().get_face_image,
+    )
 
-    doc = searcher.get_photo_image(decoded_filename)
-    if not doc:
-        raise HTTPException(
-            status_code=404, detail=f"No image found for {decoded_filename}"
-        )
 
-    try:
-        img_bytes = decode_image_field(doc)
-        return Response(content=img_bytes, media_type="image/jpeg")
-    except Exception as e:
-        logger.error("Error decoding photo image for %s: %s", decoded_filename, e)
-        raise HTTPException(
-            status_code=500, detail=str(e)
-        ) from e  # pylint: disable=raise-missing-from
+@app.get("/photo_image/{filename}")
+def get_photo_image(filename: str, request: Request) -> Response:
+    """Return the image bytes for a photo by filename."""
+    decoded_filename = unquote(filename)
+    logger.debug("Fetching photo image for decoded filename: %s", decoded_filename)
+    return filename_image_response(
+        request,
+        "photo image",
+        PHOTO_IMAGE_PREFIX,
+        decoded_filename,
+        get_searcher().get_photo_image,
+    )
@@ -1,10 +1,27 @@
-"""Unit tests for FaceSearcher and RAGEngine."""
+"""Unit tests for FaceSearcher, RAGEngine and the API routes."""
 
+import io
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 import pytest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 import numpy as np
+from bson import ObjectId
+from bson.binary import Binary, BinaryVectorDtype
+from fastapi.testclient import TestClient
+from pymongo.errors import AutoReconnect, OperationFailure, ServerSelectionTimeoutError
+from app.config import settings
 from app.face_search import FaceSearcher
-from app.rag_engine import RAGEngine
+from app.migrations import migrate_image_fields
+from app.rag_engine import EMBEDDING_PATH, RAGEngine
+from app.responses import ORJSONResponse, ndjson_chunks
+from app.utils import to_jsonable
+from app import _simkernel, vector_index
+from app.vector_index import PhotoVectorIndex
+from app.utils.cache import TTLCache
+import main
 
 
 @pytest.fixture
@@ -43,17 +60,107 @@ def test_find_known_faces_by_name(mock_collections):
     assert results[0]["filename"] == "photo1.jpg"
 
 
+def test_find_known_faces_by_names_uses_one_query(mock_collections):
+    """Should fetch all names with one $in query and report which were found."""
+    face_collection, known_collection, photos_collection = mock_collections
+    face_collection.aggregate.return_value = [
+        {"_id": doc["filename"], "doc": doc, "names": [doc["matched_persons"]]}
+        for doc in face_collection.find.return_value
+    ]
+    searcher = FaceSearcher(face_collection, known_collection, photos_collection)
+
+    results, found = searcher.find_known_faces_by_names(["Alice", "Carol"])
+
+    face_collection.aggregate.assert_called_once()
+    pipeline = face_collection.aggregate.call_args[0][0]
+    assert pipeline[0]["$match"] == {"matched_persons": {"$in": ["Alice", "Carol"]}}
+    assert "image" in pipeline[1]["$project"]
+    assert pipeline[2]["$group"]["_id"] == {"$ifNull": ["$filename", "$_id"]}
+    assert len(results) == 2
+    assert found == {"Alice"}
+
+
+def test_find_known_faces_by_names_reports_names_from_all_copies(mock_collections):
+    """Should find a name that only appears on an older copy of a filename."""
+    face_collection, known_collection, photos_collection = mock_collections
+    newest = {"filename": "X.jpg", "matched_persons": ["Bob"]}
+    face_collection.aggregate.return_value = [
+        {"_id": "X.jpg", "doc": newest, "names": [["Alice"], ["Bob"]]}
+    ]
+    searcher = FaceSearcher(face_collection, known_collection, photos_collection)
+
+    results, found = searcher.find_known_faces_by_names(["Alice", "Bob"])
+
+    assert results == [newest]
+    assert found == {"Alice", "Bob"}
+
+
 def test_find_unknown_faces(mock_collections):
     """Should return only documents with no matched persons."""
     face_collection, known_collection, photos_collection = mock_collections
+    # The face_count > len(matched_persons) predicate is evaluated by MongoDB
+    face_collection.aggregate.return_value = [
+        {"filename": "photo2.jpg", "matched_persons": [], "face_count": 2},
+    ]
     searcher = FaceSearcher(face_collection, known_collection, photos_collection)
     results = searcher.find_unknown_faces()
 
+    pipeline = face_collection.aggregate.call_args[0][0]
+    query = pipeline[0]["$match"]
+    projection = pipeline[-1]["$project"]
+    assert query["has_faces"] is True
+    assert "$gt" in query["$expr"]
+    assert "data" in projection and "image" in projection
+    assert len(pipeline) == 2
+
     assert len(results) == 1
     assert results[0]["filename"] == "photo2.jpg"
     assert results[0]["matched_persons"] == []
 
 
+def test_find_unknown_faces_pages_server_side(mock_collections):
+    """Should push paging into the pipeline, newest first."""
+    face_collection, known_collection, photos_collection = mock_collections
+    face_collection.aggregate.return_value = []
+    searcher = FaceSearcher(face_collection, known_collection, photos_collection)
+
+    searcher.find_unknown_faces(skip=20, limit=10)
+
+    pipeline = face_collection.aggregate.call_args[0][0]
+    assert pipeline[1:4] == [{"$sort": {"_id": -1}}, {"$skip": 20}, {"$limit": 10}]
+
+
+def test_get_latest_cctv_entry_projects_metadata(mock_collections):
+    """Should fetch only metadata fields of the newest photo by default."""
+    face_collection, known_collection, photos_collection = mock_collections
+    searcher = FaceSearcher(face_collection, known_collection, photos_collection)
+
+    result = searcher.get_latest_cctv_entry()
+
+    assert result["filename"] == "latest_cctv.jpg"
+    photos_collection.find_one.assert_called_once_with(
+        projection={"_id": 1, "filename": 1, "date": 1, "camera_location": 1},
+        sort=[("date", -1)],
+    )
+
+
+def test_get_all_known_faces_is_cached(mock_collections):
+    """Should reuse the cached list until the collection version changes."""
+    face_collection, known_collection, photos_collection = mock_collections
+    known_collection.estimated_document_count.return_value = 2
+    known_collection.find_one.return_value = {"_id": "b"}
+    searcher = FaceSearcher(face_collection, known_collection, photos_collection)
+
+    first = searcher.get_all_known_faces()
+    second = searcher.get_all_known_faces()
+    assert first == second
+    assert known_collection.find.call_count == 1
+
+    known_collection.estimated_document_count.return_value = 3
+    searcher.get_all_known_faces()
+    assert known_collection.find.call_count == 2
+
+
 def test_rag_search_by_photo(mock_collections):
     """Should return list of documents enriched with similarity scores."""
     face_collection, _, _ = mock_collections
@@ -66,3 +173,613 @@ def test_rag_search_by_photo(mock_collections):
         doc = results[0]
         assert "similarity" in doc
         assert isinstance(doc["similarity"], float)
+
+
+def test_rag_search_by_photo_reads_file_objects():
+    """Should accept an upload file object and embed exactly like its bytes."""
+    face_collection = MagicMock()
+    face_collection.find.return_value = []
+    engine = RAGEngine(face_collection)
+    image = b"fake_image_data"
+
+    with patch.object(
+        engine, "_generate_embedding", wraps=engine._generate_embedding
+    ) as spy:
+        engine.search_by_photo(io.BytesIO(image), threshold=0.5)
+
+    spy.assert_called_once_with(image)
+
+
+@pytest.mark.parametrize("chunk_size", [4096, 1])
+def test_rag_search_by_photo_scores_stored_embeddings(monkeypatch, chunk_size):
+    """Should score every stored embedding and keep only those above threshold."""
+    monkeypatch.setattr("app.rag_engine.SEARCH_CHUNK_SIZE", chunk_size)
+    face_collection = MagicMock()
+    engine = RAGEngine(face_collection)
+    image = b"fake_image_data"
+    query_vec = engine._generate_embedding(image)
+
+    stored = [
+        {
+            "_id": 1,
+            "filename": "match.jpg",
+            "search_embeddings": {"face_embedding": query_vec.tobytes()},
+        },
+        {
+            "_id": 2,
+            "filename": "opposite.jpg",
+            "search_embeddings": {"face_embedding": (-query_vec).tobytes()},
+        },
+        {
+            "_id": 3,
+            "filename": "bson_vector.jpg",
+            "search_embeddings": {
+                "face_embedding": Binary.from_vector(
+                    query_vec.tolist(), BinaryVectorDtype.FLOAT32
+                )
+            },
+        },
+        {
+            "_id": 4,
+            "filename": "wrong_dim.jpg",
+            "search_embeddings": {"face_embedding": query_vec[:64].tobytes()},
+        },
+        {"_id": 5, "filename": "no_embedding.jpg", "search_embeddings": {}},
+    ]
+    face_collection.find.side_effect = lambda query, *args, **kwargs: (
+        [doc for doc in stored if doc["_id"] in query["_id"]["$in"]]
+        if "_id" in query
+        else stored
+    )
+
+    results = engine.search_by_photo(image, threshold=0.5)
+
+    _, scan_projection = face_collection.find.call_args_list[0][0]
+    assert scan_projection == {"search_embeddings.face_embedding": 1}
+    assert face_collection.find.call_args[0][0] == {"_id": {"$in": [1, 3]}}
+    assert face_collection.find.call_args[0][1]["search_embeddings.face_embedding"] == 0
+    assert [doc["filename"] for doc in results] == ["match.jpg", "bson_vector.jpg"]
+    assert results[0]["similarity"] == pytest.approx(1.0, abs=1e-5)
+    assert results[1]["similarity"] == pytest.approx(1.0, abs=1e-5)
+
+
+def test_rag_search_by_photo_uses_vector_search(monkeypatch):
+    """Should delegate scoring to `$vectorSearch` when an index is configured."""
+    monkeypatch.setattr(settings, "vector_search_index", "face_embedding_index")
+    face_collection = MagicMock()
+    face_collection.aggregate.return_value = [
+        {"filename": "match.jpg", "similarity": 0.9}
+    ]
+    engine = RAGEngine(face_collection)
+
+    results = engine.search_by_photo(b"fake_image_data", threshold=0.5)
+
+    face_collection.find.assert_not_called()
+    pipeline = face_collection.aggregate.call_args[0][0]
+    assert pipeline[0]["$vectorSearch"]["index"] == "face_embedding_index"
+    assert {"$match": {"similarity": {"$gte": 0.5}}} in pipeline
+    assert results == [{"filename": "match.jpg", "similarity": 0.9}]
+
+
+def test_rag_search_by_photo_uses_cached_index(monkeypatch):
+    """Should answer from the in-process index and only fetch matched documents."""
+    monkeypatch.setattr(settings, "ann_index", True)
+    face_collection = MagicMock()
+    engine = RAGEngine(face_collection)
+    image = b"fake_image_data"
+    query_vec = engine._generate_embedding(image)
+
+    embeddings = [
+        {"_id": 1, "search_embeddings": {"face_embedding": query_vec.tobytes()}},
+        {"_id": 2, "search_embeddings": {"face_embedding": (-query_vec).tobytes()}},
+    ]
+    face_collection.estimated_document_count.return_value = 2
+    face_collection.find_one.return_value = {"_id": 2}
+    face_collection.find.side_effect = lambda query, *args, **kwargs: (
+        [{"_id": 1, "filename": "match.jpg"}]
+        if "$in" in query.get("_id", {})
+        else embeddings
+    )
+
+    first = engine.search_by_photo(image, threshold=0.5)
+    second = engine.search_by_photo(image, threshold=0.5)
+
+    assert [doc["filename"] for doc in first] == ["match.jpg"]
+    assert first == second
+    # One scan to build the index, then one $in lookup per search
+    assert face_collection.find.call_count == 3
+
+
+def test_find_photos_with_people_scores_all_names_in_one_scan():
+    """Should fetch known embeddings once and return per-name matches."""
+    face_collection, known_collection = MagicMock(), MagicMock()
+    engine = RAGEngine(face_collection, known_collection)
+
+    alice = np.zeros(128, dtype=np.float32)
+    alice[0] = 1.0
+    bob = np.zeros(128, dtype=np.float32)
+    bob[1] = 1.0
+    known_collection.find.return_value = [
+        {"name": "Alice", "embedding": alice.tolist()},
+        {"name": "Bob", "embedding": bob.tobytes()},
+    ]
+    stored = [
+        {
+            "_id": 1,
+            "filename": "alice.jpg",
+            "search_embeddings": {"face_embedding": alice.tobytes()},
+        },
+        {
+            "_id": 2,
+            "filename": "bob.jpg",
+            "search_embeddings": {"face_embedding": bob.tobytes()},
+        },
+    ]
+    face_collection.find.side_effect = lambda query, *args, **kwargs: (
+        [doc for doc in stored if doc["_id"] in query["_id"]["$in"]]
+        if "_id" in query
+        else stored
+    )
+
+    results = engine.find_photos_with_people(["Alice", "Bob", "Carol"], threshold=0.9)
+
+    known_collection.find.assert_called_once()
+    # One embedding scan, then one $in lookup for the matches of every name
+    assert face_collection.find.call_count == 2
+    assert [doc["filename"] for doc in results["Alice"]] == ["alice.jpg"]
+    assert [doc["filename"] for doc in results["Bob"]] == ["bob.jpg"]
+    assert results["Carol"] == []
+
+
+def test_rag_search_by_photo_scans_face_vectors(monkeypatch):
+    """Should scan the slim face_vectors copy and fetch only matched photos."""
+    monkeypatch.setattr(settings, "face_vectors_collection", "face_vectors")
+    face_collection = MagicMock()
+    engine = RAGEngine(face_collection, MagicMock())
+    image = b"fake_image_data"
+    query_vec = engine._generate_embedding(image)
+
+    engine.vectors_collection.find.return_value = [
+        {"_id": 1, "embedding": query_vec.tobytes()},
+        {"_id": 2, "embedding": (-query_vec).tobytes()},
+    ]
+    face_collection.find.return_value = [{"_id": 1, "filename": "match.jpg"}]
+
+    results = engine.search_by_photo(image, threshold=0.5)
+
+    assert face_collection.find.call_args[0][0] == {"_id": {"$in": [1]}}
+    assert [doc["filename"] for doc in results] == ["match.jpg"]
+    assert results[0]["similarity"] == pytest.approx(1.0, abs=1e-5)
+
+
+def test_sync_face_vectors_copies_only_new_photos(monkeypatch):
+    """Should merge photos newer than the copy once, and log Mongo errors."""
+    monkeypatch.setattr(settings, "face_vectors_collection", "face_vectors")
+    face_collection = MagicMock()
+    engine = RAGEngine(face_collection, MagicMock())
+    face_collection.find_one.return_value = {"_id": 9}
+    engine.vectors_collection.find_one.return_value = {"_id": 5}
+
+    engine.sync_face_vectors()
+    engine.sync_face_vectors()
+
+    face_collection.aggregate.assert_called_once()
+    pipeline = face_collection.aggregate.call_args[0][0]
+    assert pipeline[0]["$match"]["_id"] == {"$gt": 5}
+    assert pipeline[1]["$project"] == {"embedding": f"${EMBEDDING_PATH}"}
+
+    face_collection.find_one.return_value = {"_id": 10}
+    face_collection.aggregate.side_effect = OperationFailure("not authorized")
+    engine.sync_face_vectors()
+    assert engine._synced_id == 9
+
+
+def test_find_photos_with_people_scores_cached_index(monkeypatch):
+    """Should score the cached photo matrix and fetch the union of matches once."""
+    monkeypatch.setattr(settings, "ann_index", True)
+    face_collection, known_collection = MagicMock(), MagicMock()
+    engine = RAGEngine(face_collection, known_collection)
+
+    alice = np.zeros(128, dtype=np.float32)
+    alice[0] = 1.0
+    known_collection.find.return_value = [{"name": "Alice", "embedding": alice}]
+    face_collection.estimated_document_count.return_value = 1
+    face_collection.find_one.return_value = {"_id": 7}
+    face_collection.find.side_effect = lambda query, *args, **kwargs: (
+        [{"_id": 7, "filename": "alice.jpg"}]
+        if "$in" in query.get("_id", {})
+        else [{"_id": 7, "search_embeddings": {"face_embedding": alice.tobytes()}}]
+    )
+
+    results = engine.find_photos_with_people(["Alice", "Bob"], threshold=0.9)
+
+    assert [doc["filename"] for doc in results["Alice"]] == ["alice.jpg"]
+    assert results["Bob"] == []
+
+
+def test_quantized_index_reranks_exactly(monkeypatch):
+    """Int8 candidate selection should return exact float32 top-k scores."""
+    pytest.importorskip("numba")
+    monkeypatch.setattr(vector_index, "hnswlib", None)
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((500, 128)).astype(np.float32)
+    index = PhotoVectorIndex(list(range(500)), vectors, quantize=True)
+    query = index.vectors[42]
+
+    rows, sims = index.search(query, k=5)
+
+    exact = index.vectors @ query
+    assert rows[0] == 42
+    np.testing.assert_allclose(sims, np.sort(exact)[::-1][:5], rtol=1e-5)
+
+
+def test_index_builds_hnsw_graph_only_for_large_galleries(monkeypatch):
+    """Small galleries should be searched exactly and large ones through HNSW."""
+    pytest.importorskip("hnswlib")
+    rng = np.random.default_rng(1)
+    vectors = rng.standard_normal((200, 128)).astype(np.float32)
+
+    small = PhotoVectorIndex(list(range(200)), vectors)
+    monkeypatch.setattr(vector_index, "HNSW_MIN_ROWS", 100)
+    large = PhotoVectorIndex(list(range(200)), vectors)
+
+    assert small._hnsw is None
+    assert large._hnsw is not None
+    for index in (small, large):
+        rows, sims = index.search(index.vectors[7], k=3)
+        assert rows[0] == 7
+        assert sims[0] == pytest.approx(1.0, abs=1e-5)
+
+
+def test_index_add_appends_rows_to_hnsw_graph(monkeypatch):
+    """Should insert new rows into the existing graph, growing it as needed."""
+    pytest.importorskip("hnswlib")
+    monkeypatch.setattr(vector_index, "HNSW_MIN_ROWS", 100)
+    rng = np.random.default_rng(2)
+    vectors = rng.standard_normal((300, 128)).astype(np.float32)
+    index = PhotoVectorIndex(list(range(150)), vectors[:150])
+    graph = index._hnsw
+
+    index.add(list(range(150, 300)), vectors[150:])
+
+    assert index._hnsw is graph
+    assert graph.get_current_count() == 300
+    assert index.ids == list(range(300))
+    rows, sims = index.search(index.vectors[250], k=3)
+    assert rows[0] == 250
+    assert sims[0] == pytest.approx(1.0, abs=1e-5)
+
+
+def test_get_face_images_fetches_in_bounded_batches(mock_collections, monkeypatch):
+    """Should look up many filenames with chunked $in queries keyed by filename."""
+    monkeypatch.setattr("app.face_search.IN_QUERY_CHUNK", 2)
+    face_collection, known_collection, photo_collection = mock_collections
+    face_collection.find.side_effect = lambda query, projection, **kwargs: [
+        {"filename": name, "image": b"jpg"} for name in query["filename"]["$in"]
+    ]
+    searcher = FaceSearcher(face_collection, known_collection, photo_collection)
+
+    images = searcher.get_face_images(["a.jpg", "b.jpg", "a.jpg", "c.jpg"])
+
+    assert sorted(images) == ["a.jpg", "b.jpg", "c.jpg"]
+    assert face_collection.find.call_count == 2
+    assert face_collection.find.call_args[0][1] == {
+        "_id": 0,
+        "image": 1,
+        "data": 1,
+        "filename": 1,
+    }
+
+
+def test_photo_index_grows_past_low_count_estimate(monkeypatch):
+    """Should keep every embedding even when the count estimate is too low."""
+    monkeypatch.setattr(settings, "ann_index", True)
+    face_collection = MagicMock()
+    engine = RAGEngine(face_collection)
+    vectors = np.eye(128, dtype=np.float32)[:5]
+    face_collection.estimated_document_count.return_value = 1
+    face_collection.find_one.return_value = {"_id": 4}
+    face_collection.find.return_value = [
+        {"_id": i, "search_embeddings": {"face_embedding": vec.tobytes()}}
+        for i, vec in enumerate(vectors)
+    ]
+
+    index = engine._get_photo_index()
+
+    assert index.ids == [0, 1, 2, 3, 4]
+    np.testing.assert_array_equal(index.vectors, vectors)
+
+
+def test_photo_index_loads_only_new_photos_on_refresh(monkeypatch):
+    """Should append photos newer than the indexed ones instead of rebuilding."""
+    monkeypatch.setattr(settings, "ann_index", True)
+    face_collection = MagicMock()
+    engine = RAGEngine(face_collection)
+    vectors = np.eye(128, dtype=np.float32)[:3]
+    docs = [
+        {"_id": i, "search_embeddings": {"face_embedding": vec.tobytes()}}
+        for i, vec in enumerate(vectors)
+    ]
+    face_collection.estimated_document_count.return_value = 2
+    face_collection.find_one.return_value = {"_id": 1}
+    face_collection.find.return_value = docs[:2]
+    index = engine._get_photo_index()
+
+    face_collection.estimated_document_count.return_value = 3
+    face_collection.find_one.return_value = {"_id": 2}
+    face_collection.find.return_value = docs[2:]
+    refreshed = engine._get_photo_index()
+
+    assert refreshed is index
+    assert index.ids == [0, 1, 2]
+    np.testing.assert_array_equal(index.vectors, vectors)
+    query = face_collection.find.call_args.args[0]
+    assert query["_id"] == {"$gt": 1, "$lte": 2}
+
+
+@pytest.mark.skipif(
+    _simkernel._fused_scores is None, reason="Numba kernels are not available"
+)
+def test_warm_up_compiles_kernels_for_query_layouts():
+    """Should compile the Numba kernels ahead of the first search."""
+    _simkernel.warm_up(128)
+
+    assert _simkernel._fused_scores.signatures
+    assert _simkernel._int8_dots.signatures
+
+
+def test_get_photo_image_cache_is_bounded_by_bytes(mock_collections, monkeypatch):
+    """Should cache photo frames within the byte budget and skip oversized ones."""
+    monkeypatch.setattr(settings, "photo_image_cache_bytes", 10)
+    face_collection, known_collection, photos_collection = mock_collections
+    searcher = FaceSearcher(face_collection, known_collection, photos_collection)
+
+    photos_collection.find_one.return_value = {"image": b"12345678"}
+    searcher.get_photo_image("a.jpg")
+    searcher.get_photo_image("a.jpg")
+    assert photos_collection.find_one.call_count == 1
+
+    # A second 8-byte frame evicts the first to stay within 10 bytes
+    searcher.get_photo_image("b.jpg")
+    searcher.get_photo_image("a.jpg")
+    assert photos_collection.find_one.call_count == 3
+
+    photos_collection.find_one.return_value = {"image": b"x" * 11}
+    searcher.get_photo_image("big.jpg")
+    searcher.get_photo_image("big.jpg")
+    assert photos_collection.find_one.call_count == 5
+
+
+def test_migrate_image_fields_rewrites_base64_as_binary():
+    """Should store decoded JPEG bytes as BSON Binary and skip non-base64 values."""
+    collection = MagicMock()
+    collection.find.return_value = [
+        {"_id": 1, "image": "aGVs\nbG8="},
+        {"_id": 2, "data": {"$binary": {"base64": "aGk=", "subType": "00"}}},
+        {"_id": 3, "image": Binary(b"raw")},
+        {"_id": 4, "image": "data:image/jpeg;base64,aGk="},
+        {"_id": 5, "image": "/srv/cctv/frames/ab.jpg"},
+    ]
+
+    migrated = migrate_image_fields(collection)
+
+    assert migrated == 2
+    ops = collection.bulk_write.call_args[0][0]
+    assert [op._doc["$set"] for op in ops] == [
+        {"image": Binary(b"hello")},
+        {"data": Binary(b"hi")},
+    ]
+
+
+def test_orjson_response_encodes_raw_mongo_documents_like_to_jsonable():
+    """Should render ObjectId, datetime and bytes without a to_jsonable pass."""
+    doc = {
+        "_id": ObjectId(),
+        "date": datetime(2025, 1, 1, 12, 0, 0, 123456),
+        "image": Binary(b"jpg"),
+        "nested": [{"data": b"raw", "face_count": 2, "similarity": np.float32(0.5)}],
+    }
+
+    rendered = json.loads(ORJSONResponse(doc).body)
+
+    expected = to_jsonable(doc)
+    expected["nested"][0]["similarity"] = 0.5
+    assert rendered == expected
+
+
+def test_iter_unknown_faces_streams_ndjson(mock_collections):
+    """Should query lazily and encode one line per document, batched per chunk."""
+    face_collection, known_collection, photos_collection = mock_collections
+    oid = ObjectId()
+    face_collection.aggregate.return_value = iter(
+        [{"_id": oid, "face_count": 2}, {"face_count": 3}, {"face_count": 4}]
+    )
+    searcher = FaceSearcher(face_collection, known_collection, photos_collection)
+
+    docs = searcher.iter_unknown_faces()
+    face_collection.aggregate.assert_not_called()
+
+    chunks = list(ndjson_chunks(docs, batch_size=2))
+    assert chunks == [
+        f'{{"_id":"{oid}","face_count":2}}\n{{"face_count":3}}\n'.encode(),
+        b'{"face_count":4}\n',
+    ]
+
+
+def test_ttl_cache_is_safe_under_concurrent_access():
+    """Should not raise when threads read, expire and evict the same keys."""
+    interval = sys.getswitchinterval()
+    # Switch threads as often as possible so unguarded updates interleave
+    sys.setswitchinterval(1e-6)
+    cache: TTLCache[int] = TTLCache(4)
+
+    def hammer(seed: int) -> None:
+        for i in range(20_000):
+            key = (seed + i) % 8
+            cache.put(key, i)
+            # ttl=0 expires (deletes) entries other threads are reordering
+            cache.get(key, 0 if i % 3 == 0 else 60)
+
+    try:
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            for future in [pool.submit(hammer, seed) for seed in range(8)]:
+                future.result()
+    finally:
+        sys.setswitchinterval(interval)
+
+    assert len(cache) <= 4
+
+
+def test_warm_up_mongo_logs_errors_after_ping(monkeypatch, caplog):
+    """Should keep startup alive when index creation or engine warm-up fails."""
+    engine = MagicMock()
+    engine.warm_up.side_effect = ServerSelectionTimeoutError("no primary")
+    monkeypatch.setattr(main, "get_mongo_client", MagicMock)
+    monkeypatch.setattr(main, "get_mongo_collections", lambda: ())
+    monkeypatch.setattr(
+        main, "ensure_indexes", MagicMock(side_effect=AutoReconnect("reset"))
+    )
+    monkeypatch.setattr(main, "get_engine", lambda: engine)
+
+    main.warm_up_mongo()
+
+    engine.warm_up.assert_called_once()
+    assert "Could not ensure MongoDB indexes" in caplog.text
+    assert "Could not warm up the search engine" in caplog.text
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """Return a TestClient (lifespan not run) and the mocked shared searcher."""
+    searcher = MagicMock()
+    monkeypatch.setattr(main, "get_searcher", lambda: searcher)
+    monkeypatch.setattr(main, "_known_jpeg_cache", TTLCache(8))
+    monkeypatch.setattr(main, "_filename_etags", TTLCache(8))
+    return TestClient(main.app), searcher
+
+
+def test_known_faces_route_cleans_names(api):
+    """Should reject empty or oversized name lists and dedupe stripped names."""
+    client, searcher = api
+    searcher.find_known_faces_by_names.return_value = ([], {"Al"})
+
+    assert client.post("/faces/known", json=[" ", ""]).status_code == 400
+    too_many = ["x"] * (main.MAX_NAMES + 1)
+    assert client.post("/faces/known", json=too_many).status_code == 413
+    assert client.post("/faces/known/similar", json=too_many).status_code == 413
+
+    response = client.post("/faces/known", json=[" Al ", "Al", "Bo"])
+    searcher.find_known_faces_by_names.assert_called_once_with(["Al", "Bo"])
+    assert response.json()["skipped_names"] == ["Bo"]
+
+
+@pytest.mark.parametrize(
+    "if_none_match", ["{etag}", "W/{etag}", '"other", {etag}', "*"]
+)
+def test_photo_image_revalidation_returns_304(api, if_none_match):
+    """Should answer a matching If-None-Match with 304 and skip MongoDB."""
+    client, searcher = api
+    searcher.get_photo_image.return_value = {"image": b"frame"}
+
+    first = client.get("/photo_image/a.jpg")
+    etag = first.headers["etag"]
+    assert first.content == b"frame"
+    assert first.headers["cache-control"] == main.IMMUTABLE_CACHE_CONTROL
+
+    header = if_none_match.format(etag=etag)
+    second = client.get("/photo_image/a.jpg", headers={"if-none-match": header})
+    assert second.status_code == 304
+    assert second.headers["etag"] == etag
+    assert second.headers["cache-control"] == main.IMMUTABLE_CACHE_CONTROL
+    searcher.get_photo_image.assert_called_once()
+
+    stale = client.get("/photo_image/a.jpg", headers={"if-none-match": '"other"'})
+    assert stale.status_code == 200
+
+
+def test_known_face_image_sends_etag_and_ttl_max_age(api, monkeypatch):
+    """Should cache decoded known faces and answer revalidations with 304."""
+    monkeypatch.setattr(settings, "known_face_image_cache_ttl", 120.0)
+    client, searcher = api
+    searcher.get_known_face_image.return_value = {"image": b"alice"}
+
+    first = client.get("/known_face_image/Alice")
+    assert first.headers["cache-control"] == "public, max-age=120"
+    second = client.get(
+        "/known_face_image/Alice", headers={"if-none-match": first.headers["etag"]}
+    )
+
+    assert second.status_code == 304
+    searcher.get_known_face_image.assert_called_once_with("Alice")
+
+
+def test_image_routes_redirect_to_image_base_url(api, monkeypatch):
+    """Should redirect filename images to per-collection object store paths."""
+    monkeypatch.setattr(settings, "image_base_url", "https://cdn.example.com/img/")
+    client, searcher = api
+
+    face = client.get("/face_image/a b.jpg", follow_redirects=False)
+    photo = client.get("/photo_image/a b.jpg", follow_redirects=False)
+
+    assert face.status_code == photo.status_code == 307
+    assert face.headers["location"] == "https://cdn.example.com/img/faces/a%20b.jpg"
+    assert photo.headers["location"] == "https://cdn.example.com/img/photos/a%20b.jpg"
+    searcher.get_face_image.assert_not_called()
+    searcher.get_photo_image.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    ("accept", "ndjson"),
+    [
+        (None, False),
+        ("application/json", False),
+        ("application/x-ndjson", True),
+        ("application/json;q=0.5, application/x-ndjson", True),
+        ("application/x-ndjson;q=0.2, application/json", False),
+        ("application/x-ndjson;q=0", False),
+    ],
+)
+def test_unknown_faces_negotiates_ndjson(api, accept, ndjson):
+    """Should stream NDJSON only when the client prefers it."""
+    client, searcher = api
+    docs = [{"filename": "a.jpg"}, {"filename": "b.jpg"}]
+    searcher.iter_unknown_faces.return_value = iter(docs)
+    searcher.find_unknown_faces.return_value = docs
+
+    headers = {"accept": accept} if accept else {}
+    response = client.get("/faces/unknown", headers=headers)
+
+    if ndjson:
+        assert response.headers["content-type"] == main.NDJSON_MEDIA_TYPE
+        assert [json.loads(line) for line in response.text.splitlines()] == docs
+    else:
+        assert response.json() == {"results": docs}
+
+
+def test_cors_preflight_lists_methods_and_headers():
+    """Should answer preflights with the explicit lists and a one-day max-age."""
+    client = TestClient(main.app)
+    response = client.options(
+        "/faces/known",
+        headers={
+            "origin": "http://localhost:5000",
+            "access-control-request-method": "POST",
+            "access-control-request-headers": "content-type",
+        },
+    )
+
+    assert response.status_code == 200
+    assert response.headers["access-control-max-age"] == "86400"
+    assert response.headers["access-control-allow-methods"] == "GET, POST"
+    allowed = response.headers["access-control-allow-headers"].lower()
+    assert {"content-type", "authorization", "if-none-match"} <= set(
+        allowed.replace(" ", "").split(",")
+    )
+    rejected = client.options(
+        "/faces/known",
+        headers={
+            "origin": "http://localhost:5000",
+            "access-control-request-method": "DELETE",
+        },
+    )
+    assert rejected.status_code == 400